@@ -0,0 +1,69 @@
+"""
+Benchmark of the SQLite conversation persistence at 100k stored conversations
+
+Measures the initial bulk write, startup loading of conversation states,
+lazy per-user loading and a flush of a typical batch of changed users.
+
+Usage:
+    python benchmarks/bench_persistence.py [conversations]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.persistence import SQLitePersistence
+
+CONVERSATION = "sticker_conversation"
+
+def report(name: str, started: float, count: int) -> None:
+    """Prints elapsed time in total and per item"""
+    elapsed = time.perf_counter() - started
+    print(f"{name:<40} {elapsed * 1000:9.1f} ms   {elapsed / count * 1e6:8.2f} us/item")
+
+async def run(count: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "conversations.sqlite3")
+    users = list(range(1, count + 1))
+
+    persistence = SQLitePersistence(path, flush_batch_size=count * 2 + 1)
+    started = time.perf_counter()
+    for user_id in users:
+        await persistence.update_user_data(
+            user_id, {"description": f"кот в шляпе {user_id}", "sticker_path": f"/tmp/{user_id}.webp"}
+        )
+        await persistence.update_conversation(CONVERSATION, (user_id, user_id), 1)
+    await persistence.flush()
+    report(f"write {count} users + conversations", started, count)
+    print(f"database size: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    persistence = SQLitePersistence(path)
+    started = time.perf_counter()
+    await persistence.get_user_data()
+    conversations = await persistence.get_conversations(CONVERSATION)
+    report(f"startup: load {len(conversations)} conversation states", started, len(conversations))
+
+    sample = random.sample(users, 1000)
+    started = time.perf_counter()
+    for user_id in sample:
+        await persistence.refresh_user_data(user_id, {})
+    report("lazy load of 1000 users", started, len(sample))
+
+    started = time.perf_counter()
+    for user_id in sample:
+        await persistence.update_user_data(user_id, {"description": "собака", "sticker_path": None})
+        await persistence.update_conversation(CONVERSATION, (user_id, user_id), 0)
+    await persistence._flush_pending()
+    report("flush 1000 changed users", started, len(sample))
+
+    started = time.perf_counter()
+    for user_id in sample:
+        await persistence.update_user_data(user_id, {"description": "собака", "sticker_path": None})
+    report("update of 1000 unchanged users (skipped)", started, len(sample))
+    await persistence.flush()
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,49 @@
+"""
+Benchmark of the sticker post-processing stage
+
+Compares the previous plain resize to 512x512 with the alpha cleanup,
+auto-crop and outline stage on a synthetic rembg-like output.
+
+Usage:
+    python benchmarks/bench_postprocess.py [iterations]
+"""
+import os
+import sys
+import time
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.alpha_postprocess import AlphaPostProcessor
+
+def make_sample(size: int = 1024) -> Image.Image:
+    """Creates an RGBA image resembling rembg output: off-center subject with soft edges"""
+    image = Image.new("RGB", (size, size), (230, 120, 40))
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((300, 200, 820, 900), fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(2))
+    image.putalpha(mask)
+    return image
+
+def measure(name: str, func, image: Image.Image, iterations: int) -> None:
+    """Runs the function and prints the median time"""
+    func(image)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(image)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    median = timings[len(timings) // 2] * 1000
+    print(f"{name:<32} median {median:7.2f} ms   min {timings[0] * 1000:7.2f} ms")
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    image = make_sample()
+
+    measure("resize to 512x512 (previous)", lambda img: img.resize((512, 512), Image.LANCZOS), image, iterations)
+    measure("alpha cleanup + auto-crop", AlphaPostProcessor().process, image, iterations)
+    measure("alpha cleanup + crop + outline", AlphaPostProcessor(outline_width=8).process, image, iterations)
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,221 @@
+import os
 import logging
 import signal
 import sys
+import time
 import asyncio
+from src.startup import ImportProfiler
+
+# Startup options
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+WARM_UP = "--no-warm-up" not in sys.argv
+
+# Import profiling must start before the remaining imports
+import_profiler = ImportProfiler()
+if PROFILE_STARTUP:
+    import_profiler.start()
+startup_began = time.perf_counter()
+
 import nest_asyncio
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
+from telegram.ext import (
+    ApplicationBuilder, CommandHandler, MessageHandler, TypeHandler, filters, ConversationHandler, CallbackQueryHandler
+)
 
 # Config imports
+import config
 from config import TELEGRAM_BOT_TOKEN, OPENAI_API_KEY, STICKER_DATA_FILE
 
+# Optional settings with defaults for older config files
+CONVERSATION_DB_FILE = getattr(config, "CONVERSATION_DB_FILE", "conversations.sqlite3")
+RECONCILER_CHECKPOINT_FILE = getattr(config, "RECONCILER_CHECKPOINT_FILE", "reconciler_checkpoint.json")
+# Shared state for running several bot instances, local files are used when not set
+REDIS_URL = getattr(config, "REDIS_URL", None)
+# Webhook mode, required for several instances since only one of them may poll getUpdates.
+# Public HTTPS URL Telegram posts updates to, the bot long-polls when not set
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)
+WEBHOOK_LISTEN = getattr(config, "WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = getattr(config, "WEBHOOK_SECRET_TOKEN", None)
+# Instances behind one webhook, each handles the chats with chat ID % INSTANCE_COUNT == INSTANCE_INDEX
+# and forwards the other updates to their owners through Redis
+INSTANCE_COUNT = getattr(config, "INSTANCE_COUNT", 1)
+INSTANCE_INDEX = getattr(config, "INSTANCE_INDEX", 0)
+# Translation of descriptions for image models needing English prompts: "google"
+# or "marian" (offline model with Google as fallback)
+TRANSLATOR = getattr(config, "TRANSLATOR", "google")
+# Image models receiving Russian descriptions as is, e.g. ["dall-e-3"]; DALL-E 2 needs English.
+# The former TRANSLATOR = "none" stands for ["dall-e-3"]
+UNTRANSLATED_MODELS = getattr(config, "UNTRANSLATED_MODELS", ["dall-e-3"] if TRANSLATOR == "none" else [])
+MARIAN_MODEL = getattr(config, "MARIAN_MODEL", "Helsinki-NLP/opus-mt-ru-en")
+# Worker processes for image processing, 0 processes images in the bot process
+IMAGE_WORKERS = getattr(config, "IMAGE_WORKERS", 0)
+IMAGE_WORKER_MAX_JOBS = getattr(config, "IMAGE_WORKER_MAX_JOBS", 500)
+IMAGE_WORKER_MAX_RSS_MB = getattr(config, "IMAGE_WORKER_MAX_RSS_MB", 1500)
+IMAGE_WORKER_MEMORY_LIMIT_MB = getattr(config, "IMAGE_WORKER_MEMORY_LIMIT_MB", None)
+MAX_IMAGE_PIXELS = getattr(config, "MAX_IMAGE_PIXELS", 40_000_000)
+# Request tracing, spans go to the OTLP collector if set, otherwise to the JSONL file if set
+TRACE_OTLP_ENDPOINT = getattr(config, "TRACE_OTLP_ENDPOINT", None)
+TRACE_FILE = getattr(config, "TRACE_FILE", None)
+TRACE_SAMPLE_RATE = getattr(config, "TRACE_SAMPLE_RATE", 0.05)
+TRACE_SLOW_THRESHOLD = getattr(config, "TRACE_SLOW_THRESHOLD", 20.0)
+# History of sent stickers for /recent and duplicate warnings, None disables it
+STICKER_HISTORY_DB_FILE = getattr(config, "STICKER_HISTORY_DB_FILE", "sticker_history.sqlite3")
+# Diagnostics: event loop stalls longer than the threshold are logged with the blocking stack,
+# None disables the monitor; admins can take a sampling profile of the running bot with /profile
+LOOP_LAG_THRESHOLD = getattr(config, "LOOP_LAG_THRESHOLD", 0.25)
+ADMIN_USER_IDS = getattr(config, "ADMIN_USER_IDS", [])
+# Username of the bot without @, sticker set names must end with _by_<username>
+BOT_USERNAME = getattr(config, "BOT_USERNAME", "genstickerbot")
+
 # Services and handlers imports
 from src.services.image_generator import OpenAIImageGenerator
-from src.services.image_processor import StickerImageProcessor
+from src.services.image_router import RoutingImageGenerator, BackendRoute
+from src.services.translators import (
+    GoogleTranslateTranslator, MarianTranslator, PassthroughTranslator, FallbackTranslator, CachedTranslator
+)
+from src.services.image_processor import StickerImageProcessor, WorkerImageProcessor
 from src.services.sticker_storage import JSONStickerStorage
+from src.services.write_behind import WriteBehindStickerStorage
+from src.services.redis_storage import RedisStickerStorage
+from src.services.locks import LocalLockManager, RedisLockManager
+from src.services.pack_naming import PackNamer
+from src.services.sticker_history import StickerHistory
+from src.services.cache_bus import RedisInvalidationBus
+from src.services.update_router import RedisUpdateRouter
+from src.services.pack_index import PackIndex
 from src.services.telegram_client import TelegramStickerClient
 from src.services.sticker_service import StickerService
+from src.services.pack_reconciler import PackReconciler, FileCheckpointStore, RedisCheckpointStore
+from src.persistence import SQLitePersistence, RedisPersistence
+from src.diagnostics import LoopLagMonitor, SamplingProfiler
+from src.tracing import tracer, BatchSpanProcessor, JSONLSpanExporter, OTLPSpanExporter, TraceContextFilter
 from src.handlers import TelegramBotHandlers, DESCRIPTION, STICKER_OPTIONS, PACK_SELECTION, CREATE_PACK
 
 # Logging setup
 logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s', level=logging.INFO
 )
+for log_handler in logging.getLogger().handlers:
+    log_handler.addFilter(TraceContextFilter())
 logger = logging.getLogger(__name__)
 
-def create_services():
+def configure_tracing():
+    """
+    Enables request tracing if an exporter is configured
+    
+    Returns:
+        Optional[BatchSpanProcessor]: Span processor to shut down on exit, None if tracing is disabled
+    """
+    if TRACE_OTLP_ENDPOINT:
+        exporter = OTLPSpanExporter(TRACE_OTLP_ENDPOINT)
+    elif TRACE_FILE:
+        exporter = JSONLSpanExporter(TRACE_FILE)
+    else:
+        return None
+    
+    processor = BatchSpanProcessor(exporter)
+    tracer.configure(processor, sample_rate=TRACE_SAMPLE_RATE, slow_threshold=TRACE_SLOW_THRESHOLD)
+    logger.info(f"Tracing enabled, sampling {TRACE_SAMPLE_RATE:.0%} of traces faster than {TRACE_SLOW_THRESHOLD}s")
+    return processor
+
+def create_redis_client():
+    """
+    Creates the Redis client for shared state, redis is only required in multi-instance deployments
+    
+    Returns:
+        redis.Redis: Redis client returning strings
+    """
+    import redis
+    
+    return redis.Redis.from_url(REDIS_URL, decode_responses=True)
+
+def create_sticker_storage(redis_client=None):
+    """
+    Creates sticker pack storage, shared through Redis if a client is given
+    
+    Args:
+        redis_client (Optional[redis.Redis]): Redis client
+    
+    Returns:
+        StickerStorage: Sticker pack storage
+    """
+    if redis_client is None:
+        # The JSON file is saved in the background instead of on every change
+        return WriteBehindStickerStorage(JSONStickerStorage(STICKER_DATA_FILE, autosave=False))
+    
+    sticker_storage = RedisStickerStorage(redis_client)
+    # Packs saved by a single-instance deployment are moved to Redis on the first start
+    if os.path.exists(STICKER_DATA_FILE):
+        json_storage = JSONStickerStorage(STICKER_DATA_FILE)
+        sticker_storage.import_data(json_storage.data, json_storage.last_pack_ids)
+    return sticker_storage
+
+def create_translator():
+    """
+    Creates the translator of sticker descriptions shared by the image backends needing English
+    
+    Returns:
+        Translator: Configured translator with a cache
+    """
+    if TRANSLATOR == "marian":
+        translator = FallbackTranslator([MarianTranslator(MARIAN_MODEL), GoogleTranslateTranslator()])
+    else:
+        translator = GoogleTranslateTranslator()
+    return CachedTranslator(translator)
+
+def create_services(redis_client=None):
     """
     Creates and configures all necessary services with dependency injection
     
+    Args:
+        redis_client (Optional[redis.Redis]): Redis client for state shared between bot instances
+    
     Returns:
         StickerService: Configured sticker service
     """
-    # Create image generator
-    image_generator = OpenAIImageGenerator(OPENAI_API_KEY)
+    # One translator for the backends needing English, so a hedged request is translated once
+    translator = create_translator()
     
-    # Create image processor
-    image_processor = StickerImageProcessor()
+    def route_translator(model: str):
+        """Returns the translator for an image model"""
+        return PassthroughTranslator() if model in UNTRANSLATED_MODELS else translator
+    
+    # Create image generator routing between DALL-E backends
+    image_generator = RoutingImageGenerator(
+        routes=[
+            BackendRoute(
+                "dall-e-3",
+                OpenAIImageGenerator(OPENAI_API_KEY, translator=route_translator("dall-e-3")),
+                cost_per_image=0.04
+            ),
+            BackendRoute(
+                "dall-e-2",
+                OpenAIImageGenerator(
+                    OPENAI_API_KEY, model="dall-e-2", size="512x512", translator=route_translator("dall-e-2")
+                ),
+                cost_per_image=0.018,
+                weight=2.0,
+                expected_latency=8.0
+            ),
+        ],
+        hedge_after=30.0
+    )
+    
+    # Create image processor, in worker processes with bounded memory if configured
+    if IMAGE_WORKERS:
+        image_processor = WorkerImageProcessor(
+            workers=IMAGE_WORKERS,
+            max_jobs_per_worker=IMAGE_WORKER_MAX_JOBS,
+            max_rss_mb=IMAGE_WORKER_MAX_RSS_MB,
+            memory_limit_mb=IMAGE_WORKER_MEMORY_LIMIT_MB,
+            max_image_pixels=MAX_IMAGE_PIXELS
+        )
+    else:
+        image_processor = StickerImageProcessor(max_image_pixels=MAX_IMAGE_PIXELS)
     
     # Create sticker pack storage
-    sticker_storage = JSONStickerStorage(STICKER_DATA_FILE)
+    sticker_storage = create_sticker_storage(redis_client)
     
     # Create Telegram API client
     telegram_client = TelegramStickerClient(TELEGRAM_BOT_TOKEN)
@@ -46,7 +225,11 @@ def create_services():
         image_generator=image_generator,
         image_processor=image_processor,
         sticker_storage=sticker_storage,
-        telegram_client=telegram_client
+        telegram_client=telegram_client,
+        pack_index=PackIndex(sticker_storage),
+        lock_manager=RedisLockManager(redis_client) if redis_client is not None else LocalLockManager(),
+        pack_namer=PackNamer(telegram_client, BOT_USERNAME),
+        sticker_history=StickerHistory(STICKER_HISTORY_DB_FILE) if STICKER_HISTORY_DB_FILE else None
     )
     
     return sticker_service
@@ -55,24 +238,137 @@ async def main() -> None:
     """
     Main bot launch function
     """
+    span_processor = configure_tracing()
+    
+    if INSTANCE_COUNT > 1 and not (WEBHOOK_URL and REDIS_URL):
+        raise ValueError("Several bot instances require WEBHOOK_URL and REDIS_URL, polling instances conflict in getUpdates")
+    
+    # Connect to shared state if several bot instances are deployed
+    redis_client = create_redis_client() if REDIS_URL else None
+    
+    # Updates of a chat are handled by the instance owning it
+    update_router = None
+    if INSTANCE_COUNT > 1:
+        update_router = RedisUpdateRouter(redis_client, INSTANCE_INDEX, INSTANCE_COUNT)
+    
     # Create services with dependency injection
-    sticker_service = create_services()
+    sticker_service = create_services(redis_client)
+    
+    # Other instances drop their cached pack pages when this one changes a user's packs
+    invalidation_bus = None
+    if redis_client is not None:
+        invalidation_bus = RedisInvalidationBus(redis_client)
+        sticker_service.pack_index.on_invalidate = invalidation_bus.publish
+    
+    # Create diagnostics of the running bot
+    loop_monitor = LoopLagMonitor(threshold=LOOP_LAG_THRESHOLD) if LOOP_LAG_THRESHOLD else None
+    profiler = SamplingProfiler()
     
     # Create message handlers
-    handlers = TelegramBotHandlers(sticker_service)
+    handlers = TelegramBotHandlers(sticker_service, profiler, loop_monitor, ADMIN_USER_IDS)
+    
+    # Create background reconciler of stored packs against Telegram, instances share its progress through Redis
+    if redis_client is not None:
+        checkpoint_store = RedisCheckpointStore(redis_client)
+    else:
+        checkpoint_store = FileCheckpointStore(RECONCILER_CHECKPOINT_FILE)
+    reconciler = PackReconciler(
+        sticker_service.sticker_storage,
+        sticker_service.telegram_client,
+        checkpoint_store,
+        on_user_changed=sticker_service.pack_index.invalidate,
+        is_busy=sticker_service.is_busy,
+        lock_manager=sticker_service.lock_manager
+    )
+    
+    background_tasks = set()
+    
+    async def warm_up() -> None:
+        """Warms up services while the bot is already answering"""
+        await sticker_service.warm_up()
+        if PROFILE_STARTUP:
+            import_profiler.stop()
+            import_profiler.log_report("warm-up complete")
+    
+    async def post_init(application) -> None:
+        """Starts background warm-up and pack reconciliation once the application is initialized"""
+        logger.info(f"Bot is ready to poll after {time.perf_counter() - startup_began:.2f}s")
+        if PROFILE_STARTUP:
+            import_profiler.log_report("polling start")
+            if not WARM_UP:
+                import_profiler.stop()
+        
+        if WARM_UP:
+            task = asyncio.create_task(warm_up())
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        
+        reconciler.start()
+        
+        if loop_monitor is not None:
+            loop_monitor.start()
+        
+        if isinstance(sticker_service.sticker_storage, WriteBehindStickerStorage):
+            sticker_service.sticker_storage.start()
+        
+        if invalidation_bus is not None:
+            pack_index = sticker_service.pack_index
+            invalidation_bus.start(
+                on_invalidate=lambda user_id: pack_index.invalidate(user_id, notify=False),
+                on_reset=pack_index.clear
+            )
+        
+        if update_router is not None:
+            update_router.start(application)
+    
+    async def post_shutdown(application) -> None:
+        """Stops background tasks and closes connections"""
+        if update_router is not None:
+            await asyncio.to_thread(update_router.stop)
+        await reconciler.stop()
+        if loop_monitor is not None:
+            await loop_monitor.stop()
+        if isinstance(sticker_service.sticker_storage, WriteBehindStickerStorage):
+            await sticker_service.sticker_storage.stop()
+        await sticker_service.telegram_client.close()
+        await asyncio.to_thread(sticker_service.image_processor.close)
+        if sticker_service.sticker_history is not None:
+            sticker_service.sticker_history.close()
+        if invalidation_bus is not None:
+            await asyncio.to_thread(invalidation_bus.stop)
+        if redis_client is not None:
+            redis_client.close()
+        if span_processor is not None:
+            tracer.configure(None)
+            await asyncio.to_thread(span_processor.shutdown)
+    
+    # Conversation states are shared through Redis, updates of a chat reach its owner through the update router
+    if redis_client is not None:
+        persistence = RedisPersistence(redis_client)
+    else:
+        persistence = SQLitePersistence(CONVERSATION_DB_FILE)
     
     # Initialize application
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .persistence(persistence)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Configure conversation handler
     conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("start", handlers.start),
-            MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.generate_sticker)
+            MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.generate_sticker),
+            MessageHandler(filters.PHOTO | filters.Document.IMAGE, handlers.generate_sticker_from_photo)
         ],
         states={
             DESCRIPTION: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.generate_sticker)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.generate_sticker),
+                MessageHandler(filters.PHOTO | filters.Document.IMAGE, handlers.generate_sticker_from_photo)
             ],
             STICKER_OPTIONS: [
                 CallbackQueryHandler(handlers.handle_sticker_options)
@@ -85,14 +381,33 @@ async def main() -> None:
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.create_new_pack)
             ],
         },
-        fallbacks=[CommandHandler("cancel", handlers.start)]
+        fallbacks=[CommandHandler("cancel", handlers.start)],
+        name="sticker_conversation",
+        persistent=True
     )
     
+    # Forward updates of chats owned by other instances before any handler sees them
+    if update_router is not None:
+        app.add_handler(TypeHandler(object, update_router.route), group=-100)
+    
     # Add handler
     app.add_handler(conv_handler)
+    # Works in any conversation state without changing it
+    app.add_handler(CommandHandler("recent", handlers.recent_stickers))
+    app.add_handler(CommandHandler("profile", handlers.profile))
     
     # Start bot
-    await app.run_polling()
+    if WEBHOOK_URL:
+        # Requires python-telegram-bot[webhooks]
+        await app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN
+        )
+    else:
+        await app.run_polling()
 
 def signal_handler(sig, frame):
     """Signal handler for correct termination"""
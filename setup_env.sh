@@ -1,5 +1,5 @@
 #!/bin/bash
 python3 -m venv venv
 source venv/bin/activate
-pip install python-telegram-bot Pillow requests openai
+pip install python-telegram-bot Pillow numpy requests openai
 echo "Environment setup complete. To activate, run: source venv/bin/activate" 
\ No newline at end of file
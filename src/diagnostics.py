@@ -0,0 +1,193 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class LoopLagMonitor:
+    """
+    Detects callbacks blocking the event loop
+
+    A task on the loop records a heartbeat every check_interval seconds and a
+    watchdog thread checks it. When the heartbeat is late by more than threshold,
+    the stack of the loop thread is captured while the blocking call is still running.
+    """
+
+    def __init__(self, threshold: float = 0.25, check_interval: float = 0.05, max_reports: int = 20):
+        """
+        Initializes the monitor, monitoring starts with start()
+
+        Args:
+            threshold (float): Lag in seconds after which the loop counts as blocked
+            check_interval (float): Heartbeat interval in seconds
+            max_reports (int): Number of latest stalls kept for reports
+        """
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.reports: Deque[Dict[str, Any]] = deque(maxlen=max_reports)
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.last_beat = 0.0
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        """Starts monitoring, must be called from the event loop"""
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self._beat())
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+        logger.info(f"Event loop lag monitor started, threshold {self.threshold * 1000:.0f} ms")
+
+    async def stop(self) -> None:
+        """Stops monitoring"""
+        if self.task is None:
+            return
+        self.stopped.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        await asyncio.to_thread(self.thread.join)
+        self.thread = None
+
+    async def _beat(self) -> None:
+        """Records heartbeats on the event loop"""
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.check_interval)
+
+    def _lag(self) -> float:
+        """Returns how late the current heartbeat is"""
+        return time.monotonic() - self.last_beat - self.check_interval
+
+    def _watch(self) -> None:
+        """Checks heartbeats in the watchdog thread until stopped"""
+        while not self.stopped.wait(self.check_interval / 2):
+            if self._lag() < self.threshold:
+                continue
+
+            # The loop is blocked right now, so its current frame is the culprit
+            beat = self.last_beat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unknown\n"
+            del frame
+
+            # Wait for the loop to recover to measure the whole stall
+            while self.last_beat == beat and not self.stopped.wait(self.check_interval / 2):
+                pass
+            recovered = self.last_beat if self.last_beat != beat else time.monotonic()
+            lag = recovered - beat - self.check_interval
+
+            self.stalls += 1
+            self.max_lag = max(self.max_lag, lag)
+            self.reports.append({"time": time.time(), "lag": lag, "stack": stack})
+            logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms, stack of the blocking call:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns stall metrics
+
+        Returns:
+            Dict[str, Any]: Number of stalls and the longest lag in ms
+        """
+        return {"stalls": self.stalls, "max_lag_ms": round(self.max_lag * 1000, 1)}
+
+class SamplingProfiler:
+    """
+    Samples stacks of all threads of the live process
+
+    Results are in the collapsed stack format ("thread;frame;frame count" lines)
+    accepted by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, max_duration: float = 60.0):
+        """
+        Initializes the profiler
+
+        Args:
+            max_duration (float): Longest allowed profile in seconds
+        """
+        self.max_duration = max_duration
+        self.lock = threading.Lock()
+        # Own thread, so a profile starts even when the default executor is busy with image jobs
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiler")
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        """Converts a stack to a collapsed stack line, outermost frame first"""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get("__name__", code.co_filename)
+            frames.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    def is_running(self) -> bool:
+        """
+        Checks if a profile is being taken
+
+        Returns:
+            bool: True if a profile is running
+        """
+        return self.lock.locked()
+
+    def _sample(self, duration: float, interval: float) -> str:
+        """Samples all threads except the calling one for the duration"""
+        duration = min(duration, self.max_duration)
+        own_id = threading.get_ident()
+        samples: Counter = Counter()
+        sample_count = 0
+        started = time.perf_counter()
+        deadline = time.monotonic() + duration
+
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id != own_id:
+                    samples[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+            # Frames keep their locals alive, so they are not held between samples
+            del frames, frame
+            sample_count += 1
+            time.sleep(interval)
+
+        logger.info(
+            f"Sampling profile took {sample_count} samples of {len(samples)} distinct stacks "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+    async def run(self, duration: float, interval: float = 0.005) -> Optional[str]:
+        """
+        Takes a profile without blocking the event loop
+
+        Args:
+            duration (float): Profile length in seconds, limited by max_duration
+            interval (float): Time in seconds between samples
+
+        Returns:
+            Optional[str]: Collapsed stacks or None if another profile is running
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._sample, duration, interval)
+        finally:
+            self.lock.release()
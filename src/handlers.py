@@ -1,25 +1,52 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import CallbackContext, ConversationHandler
+import time
 import logging
+from typing import Any, Dict, Iterable, Optional
 from src.services.sticker_service import StickerService
+from src.services.pack_naming import is_name_taken_error
+from src.diagnostics import LoopLagMonitor, SamplingProfiler
+from src.tracing import traced, tracer
 
 # Conversation states definition
 DESCRIPTION, STICKER_OPTIONS, PACK_SELECTION, CREATE_PACK = range(4)
 
 logger = logging.getLogger(__name__)
 
+def _update_attributes(handlers, update: Update, context: CallbackContext) -> Dict[str, Any]:
+    """Builds trace attributes identifying an incoming update"""
+    return {
+        "update_id": update.update_id,
+        "user_id": update.effective_user.id if update.effective_user else None,
+        "chat_id": update.effective_chat.id if update.effective_chat else None
+    }
+
 class TelegramBotHandlers:
     """Telegram bot command and state handlers"""
     
-    def __init__(self, sticker_service: StickerService):
+    def __init__(
+        self, 
+        sticker_service: StickerService,
+        profiler: Optional[SamplingProfiler] = None,
+        loop_monitor: Optional[LoopLagMonitor] = None,
+        admin_user_ids: Iterable[int] = ()
+    ):
         """
         Initializes handlers with sticker service
         
         Args:
             sticker_service (StickerService): Service for sticker operations
+            profiler (Optional[SamplingProfiler]): Profiler of the live process for /profile
+            loop_monitor (Optional[LoopLagMonitor]): Event loop lag monitor reported by /profile
+            admin_user_ids (Iterable[int]): Users allowed to run diagnostic commands
         """
         self.sticker_service = sticker_service
+        self.profiler = profiler
+        self.loop_monitor = loop_monitor
+        self.admin_user_ids = {int(user_id) for user_id in admin_user_ids}
     
+    @traced("handler.start", root=True, attributes=_update_attributes)
     async def start(self, update: Update, context: CallbackContext) -> int:
         """
         Handler for /start command
@@ -34,6 +61,7 @@ class TelegramBotHandlers:
         await update.message.reply_text("Привет! Отправь описание картинки, чтобы сгенерировать стикер.")
         return DESCRIPTION
     
+    @traced("handler.generate_sticker", root=True, attributes=_update_attributes)
     async def generate_sticker(self, update: Update, context: CallbackContext) -> int:
         """
         Generates sticker based on description
@@ -64,8 +92,7 @@ class TelegramBotHandlers:
         context.user_data["sticker_path"] = sticker_path
         
         # Send generated sticker to user
-        with open(sticker_path, "rb") as sticker_file:
-            await update.message.reply_sticker(sticker_file)
+        await self._send_sticker(update.message, context, user_id, sticker_path, description)
         
         # Create options buttons
         keyboard = [
@@ -81,6 +108,195 @@ class TelegramBotHandlers:
         )
         return STICKER_OPTIONS
     
+    @traced("handler.generate_sticker_from_photo", root=True, attributes=_update_attributes)
+    async def generate_sticker_from_photo(self, update: Update, context: CallbackContext) -> int:
+        """
+        Creates sticker from a photo or an image document sent by the user
+        
+        Args:
+            update (Update): Telegram update object
+            context (CallbackContext): Conversation context
+        
+        Returns:
+            int: Next dialog state
+        """
+        message = update.message
+        
+        if message.photo:
+            # Smallest size that still has enough pixels for a sticker, saves download time
+            photo = next(
+                (size for size in message.photo if max(size.width, size.height) >= 1024),
+                message.photo[-1]
+            )
+            file_id = photo.file_id
+        else:
+            file_id = message.document.file_id
+        
+        await message.reply_text("Делаю стикер из изображения...")
+        
+        success, result_message, sticker_path = await self.sticker_service.generate_sticker_from_photo(file_id)
+        
+        if not success:
+            await message.reply_text(f"❌ {result_message}")
+            return DESCRIPTION
+        
+        # Save sticker path in context for further use, a photo sticker has no description to regenerate from
+        context.user_data["sticker_path"] = sticker_path
+        context.user_data.pop("description", None)
+        
+        # Send generated sticker to user
+        await self._send_sticker(message, context, str(message.from_user.id), sticker_path, None)
+        
+        # Processing a photo is deterministic, so there is no regeneration option
+        keyboard = [
+            [InlineKeyboardButton("Добавить стикер в пак", callback_data="add_sticker")],
+            [InlineKeyboardButton("Закончить", callback_data="finish")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await message.reply_text(
+            "Выберите действие:",
+            reply_markup=reply_markup
+        )
+        return STICKER_OPTIONS
+    
+    async def _send_sticker(
+        self, 
+        message, 
+        context: CallbackContext, 
+        user_id: str, 
+        sticker_path: str, 
+        prompt: Optional[str]
+    ) -> None:
+        """
+        Sends a sticker to the user and saves it to the user's history
+        
+        Args:
+            message (Message): Message to reply to
+            context (CallbackContext): Conversation context
+            user_id (str): User ID
+            sticker_path (str): Path to sticker file
+            prompt (Optional[str]): Sticker description, None for stickers made from photos
+        """
+        with tracer.span("handler.send_sticker"), open(sticker_path, "rb") as sticker_file:
+            sent = await message.reply_sticker(sticker_file)
+        
+        # The file ID lets the sticker be sent again later without regenerating it
+        context.user_data["history_id"] = await self.sticker_service.record_sticker(
+            user_id, sticker_path, sent.sticker.file_id, prompt
+        )
+    
+    @traced("handler.recent_stickers", root=True, attributes=_update_attributes)
+    async def recent_stickers(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handler for /recent command, sends the latest stickers again
+        
+        Args:
+            update (Update): Telegram update object
+            context (CallbackContext): Conversation context
+        """
+        user_id = str(update.message.from_user.id)
+        entries = await self.sticker_service.get_recent_stickers(user_id)
+        
+        if not entries:
+            await update.message.reply_text("У вас пока нет созданных стикеров.")
+            return
+        
+        await update.message.reply_text("Ваши последние стикеры:")
+        for entry in entries:
+            await update.message.reply_sticker(entry["file_id"])
+            if entry["prompt"]:
+                await update.message.reply_text(entry["prompt"])
+    
+    @traced("handler.profile", root=True, attributes=_update_attributes)
+    async def profile(self, update: Update, context: CallbackContext) -> None:
+        """
+        Handler for /profile [seconds] command, sends a sampling profile of the running bot
+        in the collapsed stack format for flame graph tools. Available to admins only.
+        
+        Args:
+            update (Update): Telegram update object
+            context (CallbackContext): Conversation context
+        """
+        if self.profiler is None or update.message.from_user.id not in self.admin_user_ids:
+            await update.message.reply_text("Команда недоступна.")
+            return
+        
+        try:
+            seconds = float(context.args[0]) if context.args else 10.0
+        except ValueError:
+            await update.message.reply_text("Использование: /profile [секунды]")
+            return
+        seconds = max(1.0, min(seconds, self.profiler.max_duration))
+        
+        if self.profiler.is_running():
+            await update.message.reply_text("Профилирование уже выполняется, подождите.")
+            return
+        
+        await update.message.reply_text(f"Профилирую {seconds:.0f} с...")
+        stacks = await self.profiler.run(seconds)
+        if stacks is None:
+            await update.message.reply_text("Профилирование уже выполняется, подождите.")
+            return
+        
+        caption = f"Профиль за {seconds:.0f} с (collapsed stacks для flamegraph.pl или speedscope)"
+        if self.loop_monitor is not None:
+            stats = self.loop_monitor.stats()
+            caption += f"\nБлокировок цикла событий: {stats['stalls']}, максимум {stats['max_lag_ms']:.0f} мс"
+        
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        await update.message.reply_document(
+            document=stacks.encode("utf-8"), filename=f"profile-{timestamp}.folded", caption=caption
+        )
+        
+        if self.loop_monitor is not None and self.loop_monitor.reports:
+            # Stacks of the latest blocking calls, captured while they were running
+            report = "\n".join(
+                f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stall['time']))} "
+                f"blocked {stall['lag'] * 1000:.0f} ms\n{stall['stack']}"
+                for stall in self.loop_monitor.reports
+            )
+            await update.message.reply_document(
+                document=report.encode("utf-8"), filename=f"loop-stalls-{timestamp}.txt"
+            )
+    
+    async def _build_pack_keyboard(self, user_id: str, page: int) -> Optional[InlineKeyboardMarkup]:
+        """
+        Builds a page of the pack selection keyboard
+        
+        Args:
+            user_id (str): User ID
+            page (int): Page number starting from 0
+            
+        Returns:
+            Optional[InlineKeyboardMarkup]: Keyboard or None if the user has no packs
+        """
+        packs, page, total_pages = await self.sticker_service.get_pack_page(user_id, page)
+        if not packs:
+            return None
+        
+        # Short numeric IDs keep callback data within Telegram's 64 byte limit
+        keyboard = [
+            [InlineKeyboardButton(display_name, callback_data=f"pack:{pack_id}")]
+            for pack_id, display_name in packs
+        ]
+        
+        if total_pages > 1:
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton("◀️", callback_data=f"packs_page:{page - 1}"))
+            navigation.append(InlineKeyboardButton(f"{page + 1}/{total_pages}", callback_data=f"packs_page:{page}"))
+            if page < total_pages - 1:
+                navigation.append(InlineKeyboardButton("▶️", callback_data=f"packs_page:{page + 1}"))
+            keyboard.append(navigation)
+        
+        # Add buttons for creating new pack and cancellation
+        keyboard.append([InlineKeyboardButton("Создать новый пак", callback_data="create_new_pack")])
+        keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel_add")])
+        
+        return InlineKeyboardMarkup(keyboard)
+    
+    @traced("handler.handle_sticker_options", root=True, attributes=_update_attributes)
     async def handle_sticker_options(self, update: Update, context: CallbackContext) -> int:
         """
         Handles sticker option selection buttons
@@ -100,20 +316,9 @@ class TelegramBotHandlers:
         
         if option == "add_sticker":
             # Check if user has existing sticker packs
-            user_packs = self.sticker_service.get_user_sticker_packs(user_id)
+            reply_markup = await self._build_pack_keyboard(user_id, 0)
             
-            if user_packs:
-                # Create buttons for existing packs
-                keyboard = []
-                for pack_name in user_packs.keys():
-                    keyboard.append([InlineKeyboardButton(pack_name, callback_data=f"pack_{pack_name}")])
-                
-                # Add buttons for creating new pack and cancellation
-                keyboard.append([InlineKeyboardButton("Создать новый пак", callback_data="create_new_pack")])
-                keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel_add")])
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
+            if reply_markup:
                 await query.message.reply_text(
                     "Выберите стикерпак или создайте новый:",
                     reply_markup=reply_markup
@@ -136,6 +341,10 @@ class TelegramBotHandlers:
         elif option == "regenerate":
             # Get saved description and regenerate sticker
             description = context.user_data.get("description", "")
+            if not description:
+                # Stickers made from photos have nothing to regenerate from
+                await query.message.reply_text("Этот стикер сделан из изображения, перегенерация недоступна.")
+                return STICKER_OPTIONS
             old_sticker_path = context.user_data.get("sticker_path")
             
             # Clean up old file if it exists
@@ -155,8 +364,7 @@ class TelegramBotHandlers:
             context.user_data["sticker_path"] = sticker_path
             
             # Send regenerated sticker
-            with open(sticker_path, "rb") as sticker_file:
-                await query.message.reply_sticker(sticker_file)
+            await self._send_sticker(query.message, context, user_id, sticker_path, description)
             
             # Create options buttons again
             keyboard = [
@@ -186,6 +394,7 @@ class TelegramBotHandlers:
         
         return DESCRIPTION
     
+    @traced("handler.handle_pack_selection", root=True, attributes=_update_attributes)
     async def handle_pack_selection(self, update: Update, context: CallbackContext) -> int:
         """
         Handles sticker pack selection
@@ -205,13 +414,52 @@ class TelegramBotHandlers:
 
         print(query.data)
         
-        if query.data.startswith("pack_"):
-            # User selected existing pack
-            pack_name = query.data[5:]  # Remove "pack_" prefix
+        if query.data.startswith("packs_page:"):
+            # User switched the page of the pack list
+            page = int(query.data.split(":", 1)[1])
+            reply_markup = await self._build_pack_keyboard(user_id, page)
+            if reply_markup:
+                try:
+                    await query.edit_message_reply_markup(reply_markup=reply_markup)
+                except BadRequest:
+                    # Keyboard is unchanged, e.g. the current page button was pressed
+                    pass
+            return PACK_SELECTION
+        
+        if query.data.startswith(("pack:", "pack_", "add_anyway:")):
+            # User selected existing pack, "pack_" is the name-based format of older keyboards,
+            # "add_anyway:" confirms adding a sticker similar to one already in the pack
+            pack_id = None
+            if query.data.startswith("pack_"):
+                pack_name = query.data[5:]
+            else:
+                pack_id = int(query.data.split(":", 1)[1])
+                pack_name = await self.sticker_service.resolve_pack(user_id, pack_id)
+            
+            if not pack_name:
+                await query.message.reply_text("❌ Стикерпак не найден, выберите другой.")
+                return PACK_SELECTION
+            
+            history_id = context.user_data.get("history_id")
+            if pack_id is not None and not query.data.startswith("add_anyway:"):
+                duplicate = await self.sticker_service.find_duplicate_in_pack(user_id, pack_name, history_id)
+                if duplicate:
+                    keyboard = [
+                        [InlineKeyboardButton("Добавить всё равно", callback_data=f"add_anyway:{pack_id}")],
+                        [InlineKeyboardButton("Отмена", callback_data="cancel_add")]
+                    ]
+                    await query.message.reply_text("⚠️ В этом паке уже есть похожий стикер:")
+                    await query.message.reply_sticker(duplicate["file_id"])
+                    await query.message.reply_text(
+                        "Добавить новый стикер всё равно?",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                    return PACK_SELECTION
+            
             await query.message.reply_text(f"Добавляю стикер в пак '{pack_name}'...")
             
             success, message = await self.sticker_service.add_sticker_to_pack(
-                user_id, pack_name, sticker_path
+                user_id, pack_name, sticker_path, history_id
             )
             
             if success:
@@ -237,11 +485,10 @@ class TelegramBotHandlers:
             return CREATE_PACK
             
         elif query.data == "cancel_add":
-            # User canceled adding sticker to pack
-            keyboard = [
-                [InlineKeyboardButton("Перегенерировать", callback_data="regenerate")],
-                [InlineKeyboardButton("Закончить", callback_data="finish")]
-            ]
+            # User canceled adding sticker to pack, only generated stickers can be regenerated
+            keyboard = [[InlineKeyboardButton("Закончить", callback_data="finish")]]
+            if context.user_data.get("description"):
+                keyboard.insert(0, [InlineKeyboardButton("Перегенерировать", callback_data="regenerate")])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await query.message.reply_text(
@@ -252,6 +499,7 @@ class TelegramBotHandlers:
         
         return DESCRIPTION
     
+    @traced("handler.create_new_pack", root=True, attributes=_update_attributes)
     async def create_new_pack(self, update: Update, context: CallbackContext) -> int:
         """
         Creates a new sticker pack
@@ -275,7 +523,7 @@ class TelegramBotHandlers:
         await update.message.reply_text(f"Создаю новый стикерпак: {pack_name}...")
         
         success, message, sticker_set_name = await self.sticker_service.create_new_pack(
-            user_id, pack_name, sticker_path
+            user_id, pack_name, sticker_path, context.user_data.get("history_id")
         )
         
         if success:
@@ -294,7 +542,7 @@ class TelegramBotHandlers:
             return DESCRIPTION
         else:
             # If error is related to name already taken
-            if "name is already taken" in message:
+            if is_name_taken_error(message):
                 await update.message.reply_text("Попробуйте выбрать другое название для стикерпака.")
                 return CREATE_PACK
             else:
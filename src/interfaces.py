@@ -1,7 +1,23 @@
+from __future__ import annotations
 from abc import ABC, abstractmethod
-from PIL import Image
+from contextlib import asynccontextmanager
 from io import BytesIO
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, AsyncIterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+class Translator(ABC):
+    """Interface for translating sticker descriptions to the language of the image model"""
+    
+    @abstractmethod
+    def translate(self, text: str) -> str:
+        """Translates text, Russian to English by default"""
+        pass
+    
+    def warm_up(self) -> None:
+        """Loads heavy dependencies ahead of the first request"""
+        pass
 
 class ImageGenerator(ABC):
     """Interface for generating images from text descriptions"""
@@ -15,6 +31,10 @@ class ImageGenerator(ABC):
     def generate_image(self, description: str) -> Image.Image:
         """Generates an image based on text description"""
         pass
+    
+    def warm_up(self) -> None:
+        """Loads heavy dependencies ahead of the first request"""
+        pass
 
 class ImageProcessor(ABC):
     """Interface for processing images and converting them to stickers"""
@@ -28,13 +48,32 @@ class ImageProcessor(ABC):
     def convert_to_sticker(self, image: Image.Image) -> BytesIO:
         """Converts an image to sticker format"""
         pass
+    
+    @abstractmethod
+    def convert_file_to_sticker(self, data: bytes) -> BytesIO:
+        """Decodes an encoded image file and converts it to sticker format"""
+        pass
+    
+    def warm_up(self) -> None:
+        """Loads heavy dependencies ahead of the first request"""
+        pass
+    
+    def close(self) -> None:
+        """Releases processes and other resources of the processor"""
+        pass
 
 class StickerStorage(ABC):
     """Interface for storing user sticker pack data"""
     
     @abstractmethod
     def get_user_packs(self, user_id: str) -> Dict[str, Dict[str, Any]]:
-        """Gets a dictionary of sticker packs for a specific user"""
+        """
+        Gets a dictionary of sticker packs for a specific user
+        
+        Each pack has a short numeric "id" unique per user, a display "name",
+        a "stickers" list and a "last_used" timestamp. Packs synced with Telegram
+        also have the "file_ids" of their stickers and a "sticker_count".
+        """
         pass
     
     @abstractmethod
@@ -47,6 +86,21 @@ class StickerStorage(ABC):
         """Creates a new sticker pack for a user"""
         pass
     
+    @abstractmethod
+    def get_user_ids(self) -> List[str]:
+        """Gets IDs of all users with stored sticker packs"""
+        pass
+    
+    @abstractmethod
+    def update_pack_info(self, user_id: str, pack_name: str, info: Dict[str, Any]) -> bool:
+        """Updates stored pack fields with information received from Telegram, returns True if anything changed"""
+        pass
+    
+    @abstractmethod
+    def remove_pack(self, user_id: str, pack_name: str) -> None:
+        """Removes a sticker pack of a user"""
+        pass
+    
     @abstractmethod
     def save(self) -> None:
         """Saves data to persistent storage"""
@@ -79,4 +133,56 @@ class TelegramClient(ABC):
     @abstractmethod
     async def get_sticker_set_info(self, sticker_set_name: str) -> Optional[Dict[str, Any]]:
         """Gets information about a sticker set"""
-        pass
\ No newline at end of file
+        pass
+    
+    @abstractmethod
+    async def download_file(self, file_id: str, max_bytes: int) -> Tuple[bool, str, Optional[bytes]]:
+        """Downloads a file sent to the bot"""
+        pass
+    
+    @abstractmethod
+    async def lookup_sticker_set(self, sticker_set_name: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Gets information about a sticker set and whether it exists"""
+        pass
+    
+    async def warm_up(self) -> None:
+        """Opens connections ahead of the first request"""
+        pass
+
+class LockManager(ABC):
+    """Interface for named locks shared by all bot instances"""
+    
+    @abstractmethod
+    async def acquire(self, name: str, ttl: float, wait: float) -> Optional[str]:
+        """
+        Acquires a lock that expires after ttl seconds, waiting up to wait seconds
+        
+        Returns the token needed to release the lock or None if it is held by someone else.
+        """
+        pass
+    
+    @abstractmethod
+    async def release(self, name: str, token: str) -> None:
+        """Releases a lock if it is still held with the given token"""
+        pass
+    
+    @abstractmethod
+    async def extend(self, name: str, token: str, ttl: float) -> bool:
+        """Makes a lock still held with the given token expire ttl seconds from now, returns False if it was lost"""
+        pass
+    
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30.0, wait: float = 10.0) -> AsyncIterator[None]:
+        """
+        Holds a lock for the duration of the block
+        
+        Raises:
+            TimeoutError: If the lock could not be acquired in time
+        """
+        token = await self.acquire(name, ttl, wait)
+        if token is None:
+            raise TimeoutError(f"Lock {name} is busy")
+        try:
+            yield
+        finally:
+            await self.release(name, token)
\ No newline at end of file
@@ -0,0 +1,399 @@
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import abstractmethod
+from typing import Any, Dict, List, Optional, Set, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user"
+CHAT_DATA = "chat"
+BOT_DATA = "bot"
+
+class BatchedPersistence(BasePersistence):
+    """
+    Base of conversation persistences that write changes in batches
+
+    Only changed entries are written, writes are coalesced into one transaction
+    per flush, and user/chat data is loaded lazily on the first update of that
+    user or chat instead of at startup. Subclasses implement the storage access.
+    """
+
+    def __init__(
+        self,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 5.0,
+        flush_delay: float = 1.0,
+        flush_batch_size: int = 1000
+    ):
+        """
+        Initializes the persistence
+
+        Args:
+            store_data (Optional[PersistenceInput]): Kinds of data to store, user data only by default
+            update_interval (float): Interval in seconds at which the application hands over changes
+            flush_delay (float): Time in seconds to collect changes before writing them
+            flush_batch_size (int): Number of pending changes that triggers an immediate write
+        """
+        super().__init__(
+            store_data=store_data or PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.flush_delay = flush_delay
+        self.flush_batch_size = flush_batch_size
+
+        # Serialized values as last written, used to skip unchanged entries
+        self.persisted: Dict[Tuple[str, int], str] = {}
+        self.loaded: Set[Tuple[str, int]] = set()
+        # None values mark deletions
+        self.pending_data: Dict[Tuple[str, int], Optional[str]] = {}
+        self.pending_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.flush_lock = asyncio.Lock()
+
+    @abstractmethod
+    def _read(self, kind: str, entry_id: int) -> Optional[str]:
+        """Reads the serialized value of a single entry, None if it is not stored"""
+        pass
+
+    @abstractmethod
+    def _write(
+        self,
+        data: Dict[Tuple[str, int], Optional[str]],
+        conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        """Writes pending changes in a single transaction"""
+        pass
+
+    @abstractmethod
+    def _read_conversations(self, name: str) -> List[Tuple[str, str]]:
+        """Reads (Key, Serialized state) pairs of a conversation handler"""
+        pass
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Releases the storage connection"""
+        pass
+
+    def _load(self, kind: str, entry_id: int) -> Dict[Any, Any]:
+        """
+        Loads a single entry from the storage
+
+        Args:
+            kind (str): Data kind
+            entry_id (int): User or chat ID
+
+        Returns:
+            Dict[Any, Any]: Stored data or empty dictionary
+        """
+        value = self._read(kind, entry_id)
+        self.loaded.add((kind, entry_id))
+        if value is None:
+            return {}
+        self.persisted[(kind, entry_id)] = value
+        return json.loads(value)
+
+    async def _flush_pending(self) -> None:
+        """Writes all pending changes to the database"""
+        async with self.flush_lock:
+            if not self.pending_data and not self.pending_conversations:
+                return
+
+            data, self.pending_data = self.pending_data, {}
+            conversations, self.pending_conversations = self.pending_conversations, {}
+
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, data, conversations)
+            except BaseException:
+                self._restore_pending(data, conversations)
+                raise
+            logger.debug(
+                f"Persisted {len(data)} data entries and {len(conversations)} conversation states "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+
+    def _restore_pending(
+        self,
+        data: Dict[Tuple[str, int], Optional[str]],
+        conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        """Puts a batch that failed to write back into pending changes, newer changes take precedence"""
+        for key, value in data.items():
+            if key not in self.pending_data:
+                self.pending_data[key] = value
+                # The value was not written, so an equal update must not be skipped
+                if value is not None and self.persisted.get(key) == value:
+                    del self.persisted[key]
+        for key, state in conversations.items():
+            self.pending_conversations.setdefault(key, state)
+
+    async def _delayed_flush(self) -> None:
+        """Waits for more changes to accumulate and writes them, retrying after a failed write"""
+        failed = False
+        try:
+            await asyncio.sleep(self.flush_delay)
+            await self._flush_pending()
+        except Exception:
+            logger.exception("Error persisting conversation data, will retry")
+            failed = True
+        finally:
+            self.flush_task = None
+        if failed:
+            # The batch stays pending, it is written with the next attempt
+            self.flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _schedule_flush(self) -> None:
+        """Schedules a write of pending changes, or writes them now if there are many"""
+        if len(self.pending_data) + len(self.pending_conversations) >= self.flush_batch_size:
+            await self._flush_pending()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _update(self, kind: str, entry_id: int, data: Dict[Any, Any]) -> None:
+        """Marks an entry for writing if its content changed"""
+        value = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        if self.persisted.get((kind, entry_id)) == value:
+            return
+        self.persisted[(kind, entry_id)] = value
+        self.pending_data[(kind, entry_id)] = value
+        await self._schedule_flush()
+
+    async def _drop(self, kind: str, entry_id: int) -> None:
+        """Marks an entry for deletion"""
+        self.persisted.pop((kind, entry_id), None)
+        self.loaded.add((kind, entry_id))
+        self.pending_data[(kind, entry_id)] = None
+        await self._schedule_flush()
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        """Returns no data, user data is loaded lazily in refresh_user_data"""
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        """Returns no data, chat data is loaded lazily in refresh_chat_data"""
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        """Loads bot data"""
+        return await asyncio.to_thread(self._load, BOT_DATA, 0)
+
+    async def get_callback_data(self) -> None:
+        """Callback data is not stored"""
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        """
+        Loads all states of a conversation handler
+
+        Args:
+            name (str): Conversation handler name
+
+        Returns:
+            Dict[Tuple[int, ...], object]: Conversation states by conversation key
+        """
+        def load() -> Dict[Tuple[int, ...], object]:
+            rows = self._read_conversations(name)
+            return {tuple(map(int, key.split(","))): json.loads(state) for key, state in rows}
+
+        conversations = await asyncio.to_thread(load)
+        logger.info(f"Loaded {len(conversations)} conversation states for {name}")
+        return conversations
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        """
+        Marks a conversation state for writing
+
+        Args:
+            name (str): Conversation handler name
+            key (Tuple[int, ...]): Conversation key
+            new_state (Optional[object]): New state, None if the conversation ended
+        """
+        state = None if new_state is None else json.dumps(new_state)
+        self.pending_conversations[(name, ",".join(map(str, key)))] = state
+        await self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        """Marks user data for writing if it changed"""
+        await self._update(USER_DATA, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        """Marks chat data for writing if it changed"""
+        await self._update(CHAT_DATA, chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        """Marks bot data for writing if it changed"""
+        await self._update(BOT_DATA, 0, data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        """Callback data is not stored"""
+
+    async def drop_user_data(self, user_id: int) -> None:
+        """Deletes user data"""
+        await self._drop(USER_DATA, user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        """Deletes chat data"""
+        await self._drop(CHAT_DATA, chat_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        """Loads stored user data on the first update of the user"""
+        if (USER_DATA, user_id) not in self.loaded:
+            user_data.update(await asyncio.to_thread(self._load, USER_DATA, user_id))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        """Loads stored chat data on the first update of the chat"""
+        if (CHAT_DATA, chat_id) not in self.loaded:
+            chat_data.update(await asyncio.to_thread(self._load, CHAT_DATA, chat_id))
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """Bot data is loaded once at startup"""
+
+    async def flush(self) -> None:
+        """Writes all pending changes and closes the storage, called on shutdown"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self._flush_pending()
+        self._close()
+        logger.info("Conversation data flushed")
+
+class SQLitePersistence(BatchedPersistence):
+    """Conversation persistence in a SQLite file"""
+
+    def __init__(self, file_path: str, **kwargs: Any):
+        """
+        Initializes the persistence
+
+        Args:
+            file_path (str): Path to the SQLite database file
+            **kwargs: Batching options of BatchedPersistence
+        """
+        super().__init__(**kwargs)
+        self.file_path = file_path
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection_lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        """Creates database tables if they don't exist"""
+        with self.connection_lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS data ("
+                "kind TEXT NOT NULL, id INTEGER NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (kind, id)) WITHOUT ROWID"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, "
+                "PRIMARY KEY (name, key)) WITHOUT ROWID"
+            )
+
+    def _read(self, kind: str, entry_id: int) -> Optional[str]:
+        """Reads the serialized value of a single entry"""
+        with self.connection_lock:
+            row = self.connection.execute(
+                "SELECT value FROM data WHERE kind = ? AND id = ?", (kind, entry_id)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def _write(
+        self,
+        data: Dict[Tuple[str, int], Optional[str]],
+        conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        """Writes pending changes in a single transaction"""
+        with self.connection_lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO data (kind, id, value) VALUES (?, ?, ?)",
+                [(kind, entry_id, value) for (kind, entry_id), value in data.items() if value is not None]
+            )
+            self.connection.executemany(
+                "DELETE FROM data WHERE kind = ? AND id = ?",
+                [key for key, value in data.items() if value is None]
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+            )
+            self.connection.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [key for key, state in conversations.items() if state is None]
+            )
+
+    def _read_conversations(self, name: str) -> List[Tuple[str, str]]:
+        """Reads (Key, Serialized state) pairs of a conversation handler"""
+        with self.connection_lock:
+            return self.connection.execute(
+                "SELECT key, state FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+
+    def _close(self) -> None:
+        """Closes the database"""
+        with self.connection_lock:
+            self.connection.close()
+
+class RedisPersistence(BatchedPersistence):
+    """
+    Conversation persistence in Redis shared by several bot instances
+
+    The application keeps conversation states and user data in memory between
+    updates, so updates of one chat must be handled by the same instance:
+    the instances run in webhook mode and forward updates of chats they don't
+    own with RedisUpdateRouter. Shared storage lets another instance take over
+    the user's conversation after a restart or a change of the instance count.
+    """
+
+    def __init__(self, client: Any, prefix: str = "stickers:persistence:", **kwargs: Any):
+        """
+        Initializes the persistence
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            prefix (str): Prefix of persistence keys
+            **kwargs: Batching options of BatchedPersistence
+        """
+        super().__init__(**kwargs)
+        self.client = client
+        self.prefix = prefix
+        self.data_key = f"{prefix}data"
+
+    def _conversations_key(self, name: str) -> str:
+        """Returns the key of the hash with states of a conversation handler"""
+        return f"{self.prefix}conversations:{name}"
+
+    def _read(self, kind: str, entry_id: int) -> Optional[str]:
+        """Reads the serialized value of a single entry"""
+        return self.client.hget(self.data_key, f"{kind}:{entry_id}")
+
+    def _write(
+        self,
+        data: Dict[Tuple[str, int], Optional[str]],
+        conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        """Writes pending changes in a single MULTI/EXEC transaction"""
+        pipe = self.client.pipeline(transaction=True)
+        for (kind, entry_id), value in data.items():
+            if value is None:
+                pipe.hdel(self.data_key, f"{kind}:{entry_id}")
+            else:
+                pipe.hset(self.data_key, f"{kind}:{entry_id}", value)
+        for (name, key), state in conversations.items():
+            if state is None:
+                pipe.hdel(self._conversations_key(name), key)
+            else:
+                pipe.hset(self._conversations_key(name), key, state)
+        pipe.execute()
+
+    def _read_conversations(self, name: str) -> List[Tuple[str, str]]:
+        """Reads (Key, Serialized state) pairs of a conversation handler"""
+        return list(self.client.hgetall(self._conversations_key(name)).items())
+
+    def _close(self) -> None:
+        """The client is owned and closed by the caller"""
@@ -0,0 +1,208 @@
+import logging
+import numpy as np
+from PIL import Image
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def threshold_alpha(alpha: np.ndarray, low: int, high: int) -> np.ndarray:
+    """
+    Clears nearly transparent pixels and makes nearly opaque pixels fully opaque
+
+    Values between the thresholds are stretched linearly to keep soft edges.
+
+    Args:
+        alpha (np.ndarray): Alpha channel, uint8
+        low (int): Values at or below are made fully transparent
+        high (int): Values at or above are made fully opaque
+
+    Returns:
+        np.ndarray: Thresholded alpha channel, uint8
+    """
+    levels = (np.arange(256, dtype=np.float32) - low) * (255.0 / (high - low))
+    lookup = np.clip(levels + 0.5, 0, 255).astype(np.uint8)
+    return lookup[alpha]
+
+def feather_alpha(alpha: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Softens the edges of the alpha channel with a separable box blur
+
+    Args:
+        alpha (np.ndarray): Alpha channel, uint8
+        radius (int): Blur radius in pixels
+
+    Returns:
+        np.ndarray: Feathered alpha channel, uint8
+    """
+    if radius <= 0:
+        return alpha
+
+    size = 2 * radius + 1
+    height, width = alpha.shape
+    padded = np.pad(alpha, radius, mode="edge").astype(np.uint32)
+
+    rows = padded[0:height].copy()
+    for offset in range(1, size):
+        rows += padded[offset:offset + height]
+
+    blurred = rows[:, 0:width].copy()
+    for offset in range(1, size):
+        blurred += rows[:, offset:offset + width]
+
+    return ((blurred + size * size // 2) // (size * size)).astype(np.uint8)
+
+def alpha_bbox(alpha: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Finds the tight bounding box of non-transparent pixels
+
+    Args:
+        alpha (np.ndarray): Alpha channel
+
+    Returns:
+        Optional[Tuple[int, int, int, int]]: (top, bottom, left, right) with exclusive
+            bottom and right, or None if the image is fully transparent
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    columns = np.flatnonzero(alpha.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(columns[0]), int(columns[-1]) + 1
+
+def dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Grey-scale dilation with an octagonal structuring element
+
+    Alternates 3x3 square and cross steps, which approximates a disk of the
+    given radius with a handful of whole-array maximum operations per step.
+
+    Args:
+        mask (np.ndarray): 2D array to dilate
+        radius (int): Dilation radius in pixels
+
+    Returns:
+        np.ndarray: Dilated array of the same shape
+    """
+    result = mask.copy()
+    for step in range(radius):
+        padded = np.pad(result, 1)
+        center = padded[1:-1, 1:-1]
+        result = np.maximum.reduce([
+            center,
+            padded[:-2, 1:-1], padded[2:, 1:-1],
+            padded[1:-1, :-2], padded[1:-1, 2:],
+        ])
+        if step % 2 == 0:
+            result = np.maximum.reduce([
+                result,
+                padded[:-2, :-2], padded[:-2, 2:],
+                padded[2:, :-2], padded[2:, 2:],
+            ])
+    return result
+
+def add_outline(rgba: np.ndarray, width: int, color: Tuple[int, int, int]) -> np.ndarray:
+    """
+    Draws an outline stroke of the given color around non-transparent pixels
+
+    Args:
+        rgba (np.ndarray): RGBA image, uint8, with at least width pixels of transparent margin
+        width (int): Stroke width in pixels
+        color (Tuple[int, int, int]): Stroke color
+
+    Returns:
+        np.ndarray: RGBA image with the stroke composited under the original pixels
+    """
+    foreground = rgba[..., 3]
+    outline = dilate(foreground, width)
+    result = rgba.copy()
+
+    # Pixels outside the content take the stroke as is
+    stroke_only = foreground == 0
+    result[stroke_only, :3] = color
+    result[stroke_only, 3] = outline[stroke_only]
+
+    # Semi-transparent content edges are composited over the stroke
+    edge = (foreground > 0) & (foreground < 255)
+    foreground_alpha = foreground[edge].astype(np.float32)[:, None] / 255.0
+    outline_alpha = outline[edge].astype(np.float32)[:, None] / 255.0
+    result_alpha = foreground_alpha + outline_alpha * (1.0 - foreground_alpha)
+    premultiplied = (
+        rgba[edge, :3].astype(np.float32) * foreground_alpha
+        + np.asarray(color, dtype=np.float32) * outline_alpha * (1.0 - foreground_alpha)
+    )
+    result[edge, :3] = np.clip(premultiplied / result_alpha + 0.5, 0, 255)
+    result[edge, 3] = np.clip(result_alpha[:, 0] * 255.0 + 0.5, 0, 255)
+    return result
+
+class AlphaPostProcessor:
+    """Cleans up the alpha mask after background removal and fits the sticker to Telegram size"""
+
+    def __init__(
+        self,
+        size: int = 512,
+        alpha_low: int = 16,
+        alpha_high: int = 240,
+        feather_radius: int = 1,
+        margin: int = 4,
+        outline_width: int = 0,
+        outline_color: Tuple[int, int, int] = (255, 255, 255)
+    ):
+        """
+        Initializes the post-processor
+
+        Args:
+            size (int): Length of the longest sticker side
+            alpha_low (int): Alpha values at or below are made fully transparent
+            alpha_high (int): Alpha values at or above are made fully opaque
+            feather_radius (int): Radius of edge feathering, 0 to disable
+            margin (int): Transparent margin around the content in the output
+            outline_width (int): Width of the outline stroke, 0 to disable
+            outline_color (Tuple[int, int, int]): Color of the outline stroke
+        """
+        self.size = size
+        self.alpha_low = alpha_low
+        self.alpha_high = alpha_high
+        self.feather_radius = feather_radius
+        self.margin = max(margin, outline_width)
+        self.outline_width = outline_width
+        self.outline_color = outline_color
+
+    def process(self, image: Image.Image) -> Image.Image:
+        """
+        Thresholds and feathers the alpha, crops to the content and fits it into the sticker size
+
+        Args:
+            image (Image.Image): Image with background removed
+
+        Returns:
+            Image.Image: RGBA image whose longest side equals the sticker size
+        """
+        image = image.convert("RGBA")
+
+        # Content bounds are searched on the raw alpha, so only the content is resampled
+        raw_alpha = np.asarray(image.getchannel("A"))
+        bbox = alpha_bbox(raw_alpha > self.alpha_low)
+        if bbox is None:
+            logger.warning("Image is fully transparent after background removal")
+            return image.resize((self.size, self.size), Image.LANCZOS)
+
+        top, bottom, left, right = bbox
+        content_size = self.size - 2 * self.margin
+        height, width = bottom - top, right - left
+        scale = content_size / max(height, width)
+        fitted_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        fitted = image.resize(fitted_size, Image.LANCZOS, box=(left, top, right, bottom))
+
+        canvas = np.zeros(
+            (fitted_size[1] + 2 * self.margin, fitted_size[0] + 2 * self.margin, 4),
+            dtype=np.uint8
+        )
+        canvas[self.margin:self.margin + fitted_size[1], self.margin:self.margin + fitted_size[0]] = fitted
+
+        # Feathering only lowers alpha, so no transparent black pixels become visible
+        alpha = threshold_alpha(canvas[..., 3], self.alpha_low, self.alpha_high)
+        canvas[..., 3] = np.minimum(alpha, feather_alpha(alpha, self.feather_radius))
+
+        if self.outline_width:
+            canvas = add_outline(canvas, self.outline_width, self.outline_color)
+
+        return Image.fromarray(canvas, "RGBA")
@@ -0,0 +1,212 @@
+import time
+import queue
+import logging
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_IMAGENET_MEAN = (0.485, 0.456, 0.406)
+_IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Input size, normalization mean and std of the rembg models whose sessions run a single
+# ONNX model and min-max normalize its first output, as in rembg's session classes.
+# Other models (cloth segmentation, SAM, BiRefNet, ...) post-process differently
+MODEL_PREPROCESSING: Dict[str, Tuple[Tuple[int, int], Tuple[float, ...], Tuple[float, ...]]] = {
+    "u2net": ((320, 320), _IMAGENET_MEAN, _IMAGENET_STD),
+    "u2netp": ((320, 320), _IMAGENET_MEAN, _IMAGENET_STD),
+    "u2net_human_seg": ((320, 320), _IMAGENET_MEAN, _IMAGENET_STD),
+    "silueta": ((320, 320), _IMAGENET_MEAN, _IMAGENET_STD),
+    "isnet-general-use": ((1024, 1024), _IMAGENET_MEAN, (1.0, 1.0, 1.0)),
+    "isnet-anime": ((1024, 1024), _IMAGENET_MEAN, (1.0, 1.0, 1.0)),
+}
+
+class BatchedSegmentationServer:
+    """Micro-batching server running rembg segmentation for concurrent requests in one ONNX call"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], object],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 5.0,
+        input_size: Tuple[int, int] = (320, 320),
+        mean: Tuple[float, float, float] = (0.485, 0.456, 0.406),
+        std: Tuple[float, float, float] = (0.229, 0.224, 0.225)
+    ):
+        """
+        Initializes the server, the worker thread starts with the first request
+
+        Args:
+            session_factory (Callable[[], object]): Returns a loaded rembg session
+            max_batch_size (int): Maximum number of images per inference
+            max_wait_ms (float): Time to wait for more requests after the first one arrives
+            input_size (Tuple[int, int]): Model input resolution
+            mean (Tuple[float, float, float]): Normalization mean of the model
+            std (Tuple[float, float, float]): Normalization standard deviation of the model
+        """
+        self.session_factory = session_factory
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.input_size = input_size
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.requests: "queue.Queue[Tuple[np.ndarray, Tuple[int, int], Future]]" = queue.Queue()
+        self.worker: Optional[threading.Thread] = None
+        self.worker_lock = threading.Lock()
+        self.batch_supported = True
+        self.batches = 0
+        self.images = 0
+
+    @classmethod
+    def for_model(
+        cls,
+        model_name: str,
+        session_factory: Callable[[], object],
+        **options: Any
+    ) -> Optional["BatchedSegmentationServer"]:
+        """
+        Creates a server with the preprocessing of a rembg model
+
+        Args:
+            model_name (str): Name of the rembg model
+            session_factory (Callable[[], object]): Returns a loaded rembg session of that model
+            **options: max_batch_size and max_wait_ms
+
+        Returns:
+            Optional[BatchedSegmentationServer]: Server or None if the model's pre- or post-processing
+                is not known, such models have to run through rembg itself
+        """
+        preprocessing = MODEL_PREPROCESSING.get(model_name)
+        if preprocessing is None:
+            return None
+        input_size, mean, std = preprocessing
+        return cls(session_factory, input_size=input_size, mean=mean, std=std, **options)
+
+    def _ensure_worker(self) -> None:
+        """Starts the worker thread if it is not running"""
+        with self.worker_lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._serve, name="rembg-batcher", daemon=True)
+                self.worker.start()
+
+    def _prepare(self, image: Image.Image) -> np.ndarray:
+        """
+        Converts an image to a normalized model input
+
+        Args:
+            image (Image.Image): Source image
+
+        Returns:
+            np.ndarray: Input tensor of shape (3, height, width)
+        """
+        resized = image.convert("RGB").resize(self.input_size, Image.LANCZOS)
+        pixels = np.asarray(resized, dtype=np.float32)
+        pixels = pixels / max(float(pixels.max()), 1e-6)
+        pixels = (pixels - self.mean) / self.std
+        return pixels.transpose(2, 0, 1)
+
+    def submit(self, image: Image.Image) -> Future:
+        """
+        Queues an image for segmentation
+
+        Args:
+            image (Image.Image): Source image
+
+        Returns:
+            Future: Resolves to the segmentation mask as an "L" image of the source size
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self.requests.put((self._prepare(image), image.size, future))
+        return future
+
+    def remove_background(self, image: Image.Image) -> Image.Image:
+        """
+        Removes background from an image through the batching server
+
+        Args:
+            image (Image.Image): Source image
+
+        Returns:
+            Image.Image: RGBA image with the mask applied as alpha
+        """
+        mask = self.submit(image).result()
+        result = image.convert("RGBA")
+        result.putalpha(mask)
+        return result
+
+    def _collect(self) -> List[Tuple[np.ndarray, Tuple[int, int], Future]]:
+        """Waits for the first request and gathers more until the batch is full or the wait expires"""
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _infer(self, session, inputs: np.ndarray) -> np.ndarray:
+        """
+        Runs the segmentation model
+
+        Models exported with a fixed batch dimension reject batched input,
+        in which case the server switches to per-image inference.
+
+        Args:
+            session: Loaded rembg session
+            inputs (np.ndarray): Batch tensor of shape (batch, 3, height, width)
+
+        Returns:
+            np.ndarray: Predictions of shape (batch, height, width)
+        """
+        inner = session.inner_session
+        input_name = inner.get_inputs()[0].name
+
+        if self.batch_supported and len(inputs) > 1:
+            try:
+                return inner.run(None, {input_name: inputs})[0][:, 0]
+            except Exception as e:
+                logger.warning(f"Model does not accept batched input, falling back to single images: {str(e)}")
+                self.batch_supported = False
+
+        return np.concatenate([inner.run(None, {input_name: item[None]})[0][:, 0] for item in inputs])
+
+    def _to_mask(self, prediction: np.ndarray, size: Tuple[int, int]) -> Image.Image:
+        """Normalizes a prediction and scales it to the source image size"""
+        low, high = float(prediction.min()), float(prediction.max())
+        normalized = (prediction - low) / max(high - low, 1e-6)
+        mask = Image.fromarray((normalized * 255).astype(np.uint8), "L")
+        return mask.resize(size, Image.LANCZOS)
+
+    def _serve(self) -> None:
+        """Worker loop: collects batches, runs inference and resolves futures"""
+        session = None
+        while True:
+            batch = self._collect()
+            futures = [future for _, _, future in batch]
+            try:
+                if session is None:
+                    session = self.session_factory()
+
+                inputs = np.stack([tensor for tensor, _, _ in batch]).astype(np.float32)
+                predictions = self._infer(session, inputs)
+                self.batches += 1
+                self.images += len(batch)
+                logger.info(
+                    f"Segmented batch of {len(batch)}, average batch size: {self.images / self.batches:.2f}"
+                )
+
+                for (_, size, future), prediction in zip(batch, predictions):
+                    future.set_result(self._to_mask(prediction, size))
+            except Exception as e:
+                logger.exception("Error in batched segmentation")
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
@@ -0,0 +1,89 @@
+import uuid
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class RedisInvalidationBus:
+    """
+    Fans out cache invalidations to all bot instances through Redis pub/sub
+
+    Every instance publishes the IDs of users whose packs it changed and drops
+    its own cached data for users changed by the other instances.
+    """
+
+    def __init__(self, client: Any, channel: str = "stickers:invalidate", reconnect_delay: float = 1.0):
+        """
+        Initializes the invalidation bus
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            channel (str): Pub/sub channel name
+            reconnect_delay (float): Pause in seconds before resubscribing after a connection error
+        """
+        self.client = client
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.instance_id = uuid.uuid4().hex
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def publish(self, user_id: str) -> None:
+        """
+        Notifies other instances that cached data of a user is stale
+
+        Args:
+            user_id (str): User ID
+        """
+        try:
+            self.client.publish(self.channel, f"{self.instance_id}:{user_id}")
+        except Exception as e:
+            # Other instances keep stale pages until their next own change of that user
+            logger.error(f"Failed to publish cache invalidation for user {user_id}: {str(e)}")
+
+    def start(self, on_invalidate: Callable[[str], None], on_reset: Callable[[], None]) -> None:
+        """
+        Starts listening for invalidations of other instances in a background thread
+
+        Args:
+            on_invalidate (Callable[[str], None]): Called with the user ID to drop cached data of
+            on_reset (Callable[[], None]): Called to drop all cached data after messages may have been missed
+        """
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._listen, args=(on_invalidate, on_reset), name="cache-invalidation", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the listener thread"""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def _listen(self, on_invalidate: Callable[[str], None], on_reset: Callable[[], None]) -> None:
+        """Receives invalidation messages until stopped, resubscribing after connection errors"""
+        reconnected = False
+        while not self.stop_event.is_set():
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                if reconnected:
+                    on_reset()
+                while not self.stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None or message["type"] != "message":
+                        continue
+                    instance_id, _, user_id = message["data"].partition(":")
+                    if instance_id != self.instance_id:
+                        on_invalidate(user_id)
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed, resubscribing: {str(e)}")
+                reconnected = True
+                self.stop_event.wait(self.reconnect_delay)
+            finally:
+                pubsub.close()
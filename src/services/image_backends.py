@@ -0,0 +1,125 @@
+import time
+import logging
+from typing import Optional
+from PIL import Image, ImageDraw
+from src.interfaces import ImageGenerator, Translator
+from src.services.translators import GoogleTranslateTranslator
+
+logger = logging.getLogger(__name__)
+
+class StableDiffusionImageGenerator(ImageGenerator):
+    """Implementation of image generator using a local Stable Diffusion model on CPU"""
+
+    def __init__(
+        self,
+        model_id: str = "stabilityai/sd-turbo",
+        num_inference_steps: int = 1,
+        size: int = 512,
+        translator: Optional[Translator] = None
+    ):
+        """
+        Initializes the local image generator, the model is loaded on first use
+
+        Args:
+            model_id (str): Hugging Face model identifier
+            num_inference_steps (int): Number of denoising steps
+            size (int): Width and height of the generated image
+            translator (Optional[Translator]): Translator of descriptions, Google Translate by default
+        """
+        self.model_id = model_id
+        self.num_inference_steps = num_inference_steps
+        self.size = size
+        self.translator = translator or GoogleTranslateTranslator()
+        self.pipeline = None
+
+    def warm_up(self) -> None:
+        """Loads the diffusion pipeline and the translator"""
+        self._get_pipeline()
+        self.translator.warm_up()
+
+    def _get_pipeline(self):
+        """Loads the diffusion pipeline on first use"""
+        if self.pipeline is None:
+            from diffusers import AutoPipelineForText2Image
+
+            logger.info(f"Loading Stable Diffusion model: {self.model_id}")
+            self.pipeline = AutoPipelineForText2Image.from_pretrained(self.model_id)
+            self.pipeline.to("cpu")
+        return self.pipeline
+
+    def translate_to_english(self, text: str) -> str:
+        """
+        Translates text from Russian to English
+
+        Args:
+            text (str): Source text in Russian
+
+        Returns:
+            str: Translated text in English
+        """
+        logger.info(f"Translating text: {text}")
+        return self.translator.translate(text)
+
+    def generate_image(self, description: str) -> Image.Image:
+        """
+        Generates an image based on text description
+
+        Args:
+            description (str): Description of the sticker in Russian
+
+        Returns:
+            Image.Image: Generated image
+        """
+        translated_description = self.translate_to_english(description)
+        # CLIP text encoder accepts only 77 tokens, so the prompt is kept short
+        prompt = f"sticker of a {translated_description}, thick white border, solid flat background"
+
+        logger.info(f"Generating image locally: {prompt}")
+        result = self._get_pipeline()(
+            prompt=prompt,
+            num_inference_steps=self.num_inference_steps,
+            guidance_scale=0.0,
+            width=self.size,
+            height=self.size
+        )
+        return result.images[0]
+
+class FixtureImageGenerator(ImageGenerator):
+    """Image generator returning a fixed image without network access, used for tests"""
+
+    def __init__(self, image_path: Optional[str] = None, latency: float = 0.0):
+        """
+        Initializes the fixture image generator
+
+        Args:
+            image_path (Optional[str]): Image to return, a simple drawn sticker is used if None
+            latency (float): Artificial delay in seconds before returning the image
+        """
+        self.image_path = image_path
+        self.latency = latency
+
+    def translate_to_english(self, text: str) -> str:
+        """Returns the text unchanged"""
+        return text
+
+    def generate_image(self, description: str) -> Image.Image:
+        """
+        Returns the fixture image
+
+        Args:
+            description (str): Description of the sticker, ignored
+
+        Returns:
+            Image.Image: Fixture image
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.image_path:
+            return Image.open(self.image_path)
+
+        image = Image.new("RGB", (1024, 1024), (40, 160, 90))
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((256, 256, 768, 768), fill=(255, 255, 255))
+        draw.ellipse((296, 296, 728, 728), fill=(230, 120, 40))
+        return image
@@ -1,26 +1,79 @@
-import openai
-import requests
+from __future__ import annotations
 from io import BytesIO
-from PIL import Image
-from deep_translator import GoogleTranslator
 import logging
-from src.interfaces import ImageGenerator
+import threading
+from typing import Optional, TYPE_CHECKING
+from src.interfaces import ImageGenerator, Translator
+from src.services.translators import GoogleTranslateTranslator
+from src.tracing import traced, tracer
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# Longest prompts accepted by the OpenAI image models, in characters
+MAX_PROMPT_LENGTH = {"dall-e-2": 1000, "dall-e-3": 4000}
+
+STICKER_PROMPT = (
+    "A high-quality sticker of a {description} with a **smooth, solid background**, "
+    "outlined with a **thick, perfectly solid white border (#FFFFFF) for clear visibility**. "
+    "The sticker should be centered and fully contained within the image boundaries, ensuring no parts extend beyond the edges. "
+    "The background must be **completely uniform**, without any gradients, shadows, textures, or patterns. "
+    "The white border must be **clean, uninterrupted, and have no transparency or anti-aliasing effects**. "
+    "The background color should **only** be in the background and must not appear anywhere else in the sticker. "
+    "There must be **no additional elements, shadows, text, or decorations outside the sticker itself**. "
+    "The image content inside the border can be of any style, as long as it remains clearly distinguishable from the background."
+)
+
+# The full prompt alone takes most of the 1000 characters DALL-E 2 accepts
+SHORT_STICKER_PROMPT = (
+    "A high-quality sticker of a {description} on a smooth, completely uniform solid background, "
+    "outlined with a thick solid white border, centered and fully inside the image. "
+    "No gradients, shadows, text or other elements outside the sticker."
+)
+
 class OpenAIImageGenerator(ImageGenerator):
     """Implementation of image generator using OpenAI API"""
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "dall-e-3",
+        size: str = "1024x1024",
+        translator: Optional[Translator] = None
+    ):
         """
         Initializes the image generator with OpenAI API key
         
         Args:
             api_key (str): API key for accessing OpenAI
+            model (str): OpenAI image model name
+            size (str): Size of the generated image
+            translator (Optional[Translator]): Translator of descriptions, Google Translate by default
         """
         self.api_key = api_key
-        self.translator = GoogleTranslator(source="ru", target="en")
+        self.model = model
+        self.size = size
+        self.translator = translator or GoogleTranslateTranslator()
+        # requests.Session is not guaranteed to be thread-safe, every generation thread gets its own
+        self.http_sessions = threading.local()
     
+    def warm_up(self) -> None:
+        """Imports the OpenAI SDK and prepares the translator and the HTTP session of the calling thread"""
+        import openai  # noqa: F401
+        self.translator.warm_up()
+        self._get_http_session()
+    
+    def _get_http_session(self):
+        """Creates the HTTP session of the current thread used to download generated images on first use"""
+        session = getattr(self.http_sessions, "session", None)
+        if session is None:
+            import requests
+            session = self.http_sessions.session = requests.Session()
+        return session
+    
+    @traced("image_generator.translate")
     def translate_to_english(self, text: str) -> str:
         """
         Translates text from Russian to English
@@ -36,7 +89,8 @@ class OpenAIImageGenerator(ImageGenerator):
     
     def generate_dalle_prompt(self, description: str) -> str:
         """
-        Creates a DALL-E prompt from the description
+        Creates a DALL-E prompt from the description, the description is shortened
+        if the prompt would exceed the length limit of the model
         
         Args:
             description (str): Description of the sticker in English
@@ -44,19 +98,16 @@ class OpenAIImageGenerator(ImageGenerator):
         Returns:
             str: Complete prompt for DALL-E
         """
-        base_prompt = (
-            f"A high-quality sticker of a {description} with a **smooth, solid background**, "
-            "outlined with a **thick, perfectly solid white border (#FFFFFF) for clear visibility**. "
-            "The sticker should be centered and fully contained within the image boundaries, ensuring no parts extend beyond the edges. "
-            "The background must be **completely uniform**, without any gradients, shadows, textures, or patterns. "
-            "The white border must be **clean, uninterrupted, and have no transparency or anti-aliasing effects**. "
-            "The background color should **only** be in the background and must not appear anywhere else in the sticker. "
-            "There must be **no additional elements, shadows, text, or decorations outside the sticker itself**. "
-            "The image content inside the border can be of any style, as long as it remains clearly distinguishable from the background."
-        )
-        
-        return base_prompt
+        template = SHORT_STICKER_PROMPT if self.model == "dall-e-2" else STICKER_PROMPT
+        prompt = template.format(description=description)
+        max_length = MAX_PROMPT_LENGTH.get(self.model)
+        if max_length is not None and len(prompt) > max_length:
+            logger.warning(f"Prompt of {len(prompt)} characters exceeds the {self.model} limit, shortening the description")
+            description = description[:max(0, max_length - (len(prompt) - len(description)))].rstrip()
+            prompt = template.format(description=description)
+        return prompt
     
+    @traced("image_generator.generate_image", attributes=lambda self, description: {"model": self.model, "size": self.size})
     def generate_image(self, description: str) -> Image.Image:
         """
         Generates an image based on text description
@@ -75,21 +126,26 @@ class OpenAIImageGenerator(ImageGenerator):
         
         logger.info(f"Sending prompt to OpenAI: {prompt}")
         
+        import openai
+        from PIL import Image
+        
         # Set API key for the request
         openai.api_key = self.api_key
         
         try:
-            response = openai.Image.create(
-                prompt=prompt,
-                n=1,
-                size="1024x1024",
-                model="dall-e-3"
-            )
+            with tracer.span("image_generator.openai_request"):
+                response = openai.Image.create(
+                    prompt=prompt,
+                    n=1,
+                    size=self.size,
+                    model=self.model
+                )
             logger.info(f"Received response from OpenAI: {response}")
             
             image_url = response['data'][0]['url']
-            response = requests.get(image_url)
-            image = Image.open(BytesIO(response.content))
+            with tracer.span("image_generator.download"):
+                response = self._get_http_session().get(image_url)
+                image = Image.open(BytesIO(response.content))
             return image
         except Exception as e:
             logger.error(f"Error generating image: {str(e)}")
@@ -1,17 +1,154 @@
+from __future__ import annotations
 import logging
-from PIL import Image
+import warnings
+import functools
+import threading
 from io import BytesIO
-from rembg import remove
+from typing import Any, Optional, TYPE_CHECKING
 from src.interfaces import ImageProcessor
+from src.tracing import traced, tracer, set_span_attributes
+from src.services.worker_pool import RecyclingProcessPool
+
+# Pillow, NumPy and the modules built on them are imported on first use, so they don't slow down startup
+if TYPE_CHECKING:
+    from PIL import Image
+    from src.services.alpha_postprocess import AlphaPostProcessor
+    from src.services.batch_segmenter import BatchedSegmentationServer
 
 logger = logging.getLogger(__name__)
 
+def limit_image_pixels(max_pixels: int) -> None:
+    """
+    Makes Pillow refuse to decode images above a pixel count in the current process
+    
+    Pillow only warns between max_pixels and twice that size, the warning is
+    turned into an error so the limit is hard.
+    
+    Args:
+        max_pixels (int): Maximum number of pixels of a decoded image
+    """
+    from PIL import Image
+    
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    warnings.simplefilter("error", Image.DecompressionBombWarning)
+
 class StickerImageProcessor(ImageProcessor):
     """Image processor for creating stickers"""
     
+    def __init__(
+        self,
+        model_name: str = "u2net",
+        post_processor: Optional[AlphaPostProcessor] = None,
+        solid_background_tolerance: Optional[float] = 24.0,
+        max_batch_size: int = 4,
+        max_batch_wait_ms: float = 5.0,
+        max_input_side: int = 1024,
+        max_image_pixels: Optional[int] = 40_000_000
+    ):
+        """
+        Initializes the image processor, the rembg model and the processing stages are loaded on first use
+        
+        Args:
+            model_name (str): Name of the rembg segmentation model, only the u2net and isnet
+                families are batched
+            post_processor (Optional[AlphaPostProcessor]): Alpha cleanup and auto-crop stage
+            solid_background_tolerance (Optional[float]): Color distance for the solid background
+                fast path, None to always use rembg
+            max_batch_size (int): Maximum number of images segmented in one rembg inference
+            max_batch_wait_ms (float): Time to wait for concurrent requests to join a batch
+            max_input_side (int): Longest side to which uploaded images are decoded
+            max_image_pixels (Optional[int]): Uploaded images with more pixels are rejected
+                before decoding, None to disable the check
+        """
+        self.model_name = model_name
+        self.post_processor = post_processor
+        self.solid_background_tolerance = solid_background_tolerance
+        self.max_input_side = max_input_side
+        self.max_image_pixels = max_image_pixels
+        self.session = None
+        self.session_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.fast_path_attempts = 0
+        self.fast_path_hits = 0
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        self.segmenter: Optional[BatchedSegmentationServer] = None
+        self.segmenter_created = False
+        self.segmenter_lock = threading.Lock()
+    
+    def warm_up(self) -> None:
+        """Loads the rembg model and the processing stages"""
+        self._get_session()
+        self._get_segmenter()
+        self._get_post_processor()
+    
+    def _get_post_processor(self) -> AlphaPostProcessor:
+        """
+        Creates the default post-processor on first use
+        
+        Returns:
+            AlphaPostProcessor: Alpha cleanup and auto-crop stage
+        """
+        if self.post_processor is None:
+            from src.services.alpha_postprocess import AlphaPostProcessor
+            self.post_processor = AlphaPostProcessor()
+        return self.post_processor
+    
+    def _get_segmenter(self) -> Optional[BatchedSegmentationServer]:
+        """
+        Creates the batching segmentation server on first use
+        
+        Returns:
+            Optional[BatchedSegmentationServer]: Server or None if the model runs through rembg directly
+        """
+        with self.segmenter_lock:
+            if not self.segmenter_created:
+                from src.services.batch_segmenter import BatchedSegmentationServer
+                
+                # Models without known preprocessing are run image by image through rembg
+                self.segmenter = BatchedSegmentationServer.for_model(
+                    self.model_name,
+                    self._get_session,
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_batch_wait_ms
+                )
+                self.segmenter_created = True
+        return self.segmenter
+    
+    def _get_session(self):
+        """
+        Loads the rembg session on first use
+        
+        Returns:
+            BaseSession: rembg inference session
+        """
+        with self.session_lock:
+            if self.session is None:
+                from rembg import new_session
+                
+                logger.info(f"Loading rembg model: {self.model_name}")
+                self.session = new_session(self.model_name)
+        return self.session
+    
+    def fast_path_hit_rate(self) -> float:
+        """
+        Returns the share of images whose background was removed without rembg
+        
+        Returns:
+            float: Hit rate from 0 to 1
+        """
+        with self.stats_lock:
+            if not self.fast_path_attempts:
+                return 0.0
+            return self.fast_path_hits / self.fast_path_attempts
+    
+    @traced("image_processor.remove_background")
     def remove_background(self, image: Image.Image) -> Image.Image:
         """
-        Removes background from an image using AI (rembg)
+        Removes background from an image
+        
+        A uniform solid background is removed with a color flood fill from the
+        edges; other images fall back to AI (rembg).
         
         Args:
             image (Image.Image): Source image
@@ -19,19 +156,30 @@ class StickerImageProcessor(ImageProcessor):
         Returns:
             Image.Image: Image with background removed
         """
-        logger.info("Removing background using AI (rembg)")
-        
-        # Convert image to bytes
-        image_bytes = BytesIO()
-        image.save(image_bytes, format="PNG")
-        image_bytes = image_bytes.getvalue()
+        if self.solid_background_tolerance is not None:
+            from src.services.solid_background import remove_solid_background
+            
+            result = remove_solid_background(image, tolerance=self.solid_background_tolerance)
+            with self.stats_lock:
+                self.fast_path_attempts += 1
+                if result is not None:
+                    self.fast_path_hits += 1
+            logger.info(f"Solid background fast path hit rate: {self.fast_path_hit_rate():.0%}")
+            
+            set_span_attributes(fast_path=result is not None)
+            if result is not None:
+                logger.info("Removed solid background without rembg")
+                return result
         
-        # Remove background
-        output_bytes = remove(image_bytes)
+        logger.info("Removing background using AI (rembg)")
+        segmenter = self._get_segmenter()
+        if segmenter is not None:
+            return segmenter.remove_background(image)
         
-        # Convert back to image
-        return Image.open(BytesIO(output_bytes))
+        from rembg import remove
+        return remove(image, session=self._get_session())
     
+    @traced("image_processor.convert_to_sticker", attributes=lambda self, image: {"input_size": f"{image.width}x{image.height}"})
     def convert_to_sticker(self, image: Image.Image) -> BytesIO:
         """
         Converts an image to sticker format
@@ -48,13 +196,160 @@ class StickerImageProcessor(ImageProcessor):
         # Remove background using AI
         processed_image = self.remove_background(image)
         
-        logger.info("Resizing and cropping image to 512x512")
-        processed_image = processed_image.resize((512, 512), Image.LANCZOS)
-
+        logger.info("Cropping to content and fitting image into 512x512")
+        with tracer.span("image_processor.post_process"):
+            processed_image = self._get_post_processor().process(processed_image)
 
         sticker_io = BytesIO()
-        processed_image.save(sticker_io, format="PNG")
+        with tracer.span("image_processor.encode"):
+            processed_image.save(sticker_io, format="PNG")
         sticker_io.seek(0)
         
         logger.info("Image conversion to sticker completed")
-        return sticker_io
\ No newline at end of file
+        return sticker_io
+    
+    @traced("image_processor.decode_image", attributes=lambda self, data: {"bytes": len(data)})
+    def decode_image(self, data: bytes) -> Image.Image:
+        """
+        Decodes an uploaded image close to the working resolution
+        
+        JPEG files are decoded in draft mode, so the decoder scales them down by
+        1/2, 1/4 or 1/8 directly and a large photo is never inflated in full.
+        Other formats are reduced right after decoding.
+        
+        Args:
+            data (bytes): Encoded image file
+            
+        Returns:
+            Image.Image: Decoded image with its longest side at most max_input_side
+            
+        Raises:
+            ValueError: If the image has more than max_image_pixels pixels
+        """
+        from PIL import Image, ImageOps
+        
+        image = Image.open(BytesIO(data))
+        original_size = image.size
+        
+        # Only the header is read so far, an oversized image is rejected before allocating pixels
+        if self.max_image_pixels and original_size[0] * original_size[1] > self.max_image_pixels:
+            raise ValueError(f"Изображение слишком большое: {original_size[0]}x{original_size[1]}")
+        target = (self.max_input_side, self.max_input_side)
+        
+        # Draft keeps both sides at or above the requested size, so the aspect-fitted
+        # sticker size is requested and the decoder picks the strongest reduction
+        scale = min(1.0, self._get_post_processor().size / max(original_size))
+        image.draft("RGB", (round(original_size[0] * scale), round(original_size[1] * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(target, Image.LANCZOS, reducing_gap=2.0)
+        
+        logger.info(f"Decoded uploaded image {original_size} to {image.size}")
+        return image
+    
+    def convert_file_to_sticker(self, data: bytes) -> BytesIO:
+        """
+        Decodes an uploaded image file and converts it to sticker format
+        
+        Args:
+            data (bytes): Encoded image file
+            
+        Returns:
+            BytesIO: Buffer with sticker data in PNG format
+        """
+        return self.convert_to_sticker(self.decode_image(data))
+
+class WorkerImageProcessor(ImageProcessor):
+    """
+    Image processor running StickerImageProcessor in recycled worker processes
+    
+    Memory of rembg, ONNX Runtime and Pillow is allocated in the workers, which
+    are replaced after a number of jobs or when their RSS grows, so the bot
+    process keeps a flat footprint. Workers refuse to decode oversized images.
+    
+    A worker runs one job at a time, so rembg micro-batching never combines
+    requests here and is disabled by default; concurrency comes from the
+    number of workers.
+    """
+    
+    def __init__(
+        self,
+        workers: int = 2,
+        max_jobs_per_worker: Optional[int] = 500,
+        max_rss_mb: Optional[float] = 1500.0,
+        memory_limit_mb: Optional[float] = None,
+        max_image_pixels: int = 40_000_000,
+        job_timeout: Optional[float] = 120.0,
+        **processor_options: Any
+    ):
+        """
+        Initializes the processor, worker processes start on warm-up or first use
+        
+        Args:
+            workers (int): Number of worker processes
+            max_jobs_per_worker (Optional[int]): Jobs after which a worker is replaced
+            max_rss_mb (Optional[float]): RSS in MB after a job above which a worker is replaced
+            memory_limit_mb (Optional[float]): Hard address space limit of a worker in MB
+            max_image_pixels (int): Maximum number of pixels of an image decoded in a worker
+            job_timeout (Optional[float]): Time in seconds after which a job is aborted
+            **processor_options: Options of StickerImageProcessor
+        """
+        # A batch would only ever hold the single image of the current job
+        processor_options.setdefault("max_batch_size", 1)
+        self.pool = RecyclingProcessPool(
+            functools.partial(StickerImageProcessor, max_image_pixels=max_image_pixels, **processor_options),
+            workers=workers,
+            max_jobs_per_worker=max_jobs_per_worker,
+            max_rss_mb=max_rss_mb,
+            memory_limit_mb=memory_limit_mb,
+            job_timeout=job_timeout,
+            initializer=limit_image_pixels,
+            initargs=(max_image_pixels,)
+        )
+    
+    def warm_up(self) -> None:
+        """Starts the worker processes, each loads the rembg model"""
+        self.pool.start()
+    
+    def close(self) -> None:
+        """Stops the worker processes"""
+        self.pool.close()
+    
+    @traced("image_processor.worker.remove_background")
+    def remove_background(self, image: Image.Image) -> Image.Image:
+        """
+        Removes background from an image in a worker process
+        
+        Args:
+            image (Image.Image): Source image
+            
+        Returns:
+            Image.Image: Image with background removed
+        """
+        return self.pool.run("remove_background", image)
+    
+    @traced("image_processor.worker.convert_to_sticker")
+    def convert_to_sticker(self, image: Image.Image) -> BytesIO:
+        """
+        Converts an image to sticker format in a worker process
+        
+        Args:
+            image (Image.Image): Source image
+            
+        Returns:
+            BytesIO: Buffer with sticker data in PNG format
+        """
+        return self.pool.run("convert_to_sticker", image)
+    
+    @traced("image_processor.worker.convert_file_to_sticker", attributes=lambda self, data: {"bytes": len(data)})
+    def convert_file_to_sticker(self, data: bytes) -> BytesIO:
+        """
+        Decodes an uploaded image file and converts it to sticker format in a worker process,
+        so a malicious file never inflates the bot process
+        
+        Args:
+            data (bytes): Encoded image file
+            
+        Returns:
+            BytesIO: Buffer with sticker data in PNG format
+        """
+        return self.pool.run("convert_file_to_sticker", data)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import List, Optional, Set, TYPE_CHECKING
+from src.interfaces import ImageGenerator
+from src.tracing import traced, set_span_attributes
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class BackendRoute:
+    """Routing settings and live statistics of a single image generation backend"""
+
+    def __init__(
+        self,
+        name: str,
+        generator: ImageGenerator,
+        cost_per_image: float = 0.0,
+        budget_per_hour: Optional[float] = None,
+        max_concurrency: int = 4,
+        weight: float = 1.0,
+        expected_latency: float = 15.0
+    ):
+        """
+        Initializes the backend route
+
+        Args:
+            name (str): Backend name used in logs
+            generator (ImageGenerator): Backend image generator
+            cost_per_image (float): Cost of one generated image
+            budget_per_hour (Optional[float]): Maximum spend per hour, None for unlimited
+            max_concurrency (int): Number of requests after which the backend is considered saturated
+            weight (float): Score multiplier, higher values make the backend less preferred
+            expected_latency (float): Latency estimate in seconds used until real measurements arrive
+        """
+        self.name = name
+        self.generator = generator
+        self.cost_per_image = cost_per_image
+        self.budget_per_hour = budget_per_hour
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+        self.latency_ewma = expected_latency
+        self.error_ewma = 0.0
+        self.in_flight = 0
+        self.spent = 0.0
+        self.window_started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def has_budget(self) -> bool:
+        """
+        Checks if the backend can accept one more image within the hourly budget
+
+        Returns:
+            bool: True if the budget allows another request
+        """
+        with self.lock:
+            if time.monotonic() - self.window_started >= 3600:
+                self.window_started = time.monotonic()
+                self.spent = 0.0
+            if self.budget_per_hour is None:
+                return True
+            return self.spent + self.cost_per_image <= self.budget_per_hour
+
+    def is_saturated(self) -> bool:
+        """Checks if the backend queue is full"""
+        return self.in_flight >= self.max_concurrency
+
+    def score(self) -> float:
+        """
+        Calculates the expected cost of sending a request to this backend
+
+        Returns:
+            float: Score, lower is better
+        """
+        queue_factor = 1.0 + self.in_flight / self.max_concurrency
+        success_rate = max(1.0 - self.error_ewma, 0.05)
+        return self.latency_ewma * queue_factor * self.weight / success_rate
+
+    def record_start(self) -> None:
+        """Registers the start of a request"""
+        with self.lock:
+            self.in_flight += 1
+            self.spent += self.cost_per_image
+
+    def record_result(self, latency: float, success: bool, alpha: float) -> None:
+        """
+        Updates latency and error statistics with a finished request
+
+        Args:
+            latency (float): Request duration in seconds
+            success (bool): Whether the request succeeded
+            alpha (float): EWMA smoothing factor
+        """
+        with self.lock:
+            self.in_flight -= 1
+            self.error_ewma = alpha * (0.0 if success else 1.0) + (1 - alpha) * self.error_ewma
+            if success:
+                self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+
+class RoutingImageGenerator(ImageGenerator):
+    """Image generator that routes each request to the best backend and hedges slow requests"""
+
+    def __init__(
+        self,
+        routes: List[BackendRoute],
+        hedge_after: Optional[float] = 30.0,
+        ewma_alpha: float = 0.2,
+        max_workers: int = 8
+    ):
+        """
+        Initializes the routing image generator
+
+        Args:
+            routes (List[BackendRoute]): Available backends, the first one is used for translation
+            hedge_after (Optional[float]): Seconds to wait for the primary backend before
+                firing a second one, None to disable hedging
+            ewma_alpha (float): Smoothing factor for latency and error statistics
+            max_workers (int): Maximum number of concurrently running backend requests
+        """
+        if not routes:
+            raise ValueError("At least one image backend is required")
+
+        self.routes = routes
+        self.hedge_after = hedge_after
+        self.ewma_alpha = ewma_alpha
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-backend")
+
+    def translate_to_english(self, text: str) -> str:
+        """
+        Translates text from Russian to English using the first backend
+
+        Args:
+            text (str): Source text in Russian
+
+        Returns:
+            str: Translated text in English
+        """
+        return self.routes[0].generator.translate_to_english(text)
+
+    def warm_up(self) -> None:
+        """Warms up all backends"""
+        for route in self.routes:
+            route.generator.warm_up()
+
+    def _rank_routes(self) -> List[BackendRoute]:
+        """
+        Orders backends by their current score
+
+        Returns:
+            List[BackendRoute]: Backends within budget, best first; saturated backends go last
+        """
+        available = [route for route in self.routes if route.has_budget()]
+        return sorted(available, key=lambda route: (route.is_saturated(), route.score()))
+
+    @traced("image_router.backend", attributes=lambda self, route, description: {"backend": route.name})
+    def _run(self, route: BackendRoute, description: str) -> Image.Image:
+        """
+        Runs a single backend request and records its statistics
+
+        Args:
+            route (BackendRoute): Backend to call
+            description (str): Description of the sticker
+
+        Returns:
+            Image.Image: Generated image
+        """
+        started = time.monotonic()
+        try:
+            image = route.generator.generate_image(description)
+        except Exception:
+            route.record_result(time.monotonic() - started, False, self.ewma_alpha)
+            raise
+
+        latency = time.monotonic() - started
+        route.record_result(latency, True, self.ewma_alpha)
+        logger.info(f"Backend {route.name} generated image in {latency:.2f}s")
+        return image
+
+    def _submit(self, route: BackendRoute, description: str) -> Future:
+        """Starts a backend request in the worker pool"""
+        route.record_start()
+        # The copied context keeps backend spans inside the trace of the request
+        return self.executor.submit(contextvars.copy_context().run, self._run, route, description)
+
+    @traced("image_router.generate_image")
+    def generate_image(self, description: str) -> Image.Image:
+        """
+        Generates an image with the best available backend
+
+        The request is hedged: if the primary backend does not answer within
+        hedge_after seconds, the next backend is started as well and the first
+        successful result wins. Failed requests fail over to the remaining backends.
+
+        Args:
+            description (str): Description of the sticker in Russian
+
+        Returns:
+            Image.Image: Generated image
+
+        Raises:
+            RuntimeError: If no backend is available within budget
+            Exception: Error of the last failed backend if all backends failed
+        """
+        candidates = self._rank_routes()
+        if not candidates:
+            raise RuntimeError("No image backend is available within budget")
+
+        logger.info(f"Routing image request to {candidates[0].name}")
+        pending: Set[Future] = {self._submit(candidates.pop(0), description)}
+        hedged = self.hedge_after is None
+        last_error: Optional[Exception] = None
+
+        while pending:
+            timeout = None if hedged or not candidates else self.hedge_after
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Primary is too slow, fire the hedge request
+                hedged = True
+                route = candidates.pop(0)
+                logger.info(f"Hedging image request to {route.name}")
+                set_span_attributes(hedged_to=route.name)
+                pending.add(self._submit(route, description))
+                continue
+
+            for future in done:
+                pending.discard(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.error(f"Image backend failed: {str(e)}")
+
+            if not pending and candidates:
+                route = candidates.pop(0)
+                logger.info(f"Failing over image request to {route.name}")
+                pending.add(self._submit(route, description))
+
+        raise last_error
@@ -0,0 +1,189 @@
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+from src.interfaces import LockManager
+from src.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# Expiration of the per-set "sticker_set:<name>" locks serializing changes of a sticker set.
+# The 30 s HTTP timeout applies to every phase of an upload (connect, write, read),
+# so the lock must outlive all of them plus the storage write
+STICKER_SET_LOCK_TTL = 120.0
+
+class LocalLockManager(LockManager):
+    """In-process locks for a single bot instance"""
+
+    def __init__(self, poll_interval: float = 0.05):
+        """
+        Initializes the lock manager
+
+        Args:
+            poll_interval (float): Pause in seconds between attempts to take a busy lock
+        """
+        self.poll_interval = poll_interval
+        # Lock name -> (Token, Expiration time)
+        self.leases: Dict[str, Tuple[str, float]] = {}
+
+    async def acquire(self, name: str, ttl: float, wait: float) -> Optional[str]:
+        """
+        Acquires a lock that expires after ttl seconds
+
+        Args:
+            name (str): Lock name
+            ttl (float): Time in seconds after which the lock is released automatically
+            wait (float): Longest time in seconds to wait for a busy lock
+
+        Returns:
+            Optional[str]: Token of the lock or None if it stayed busy
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            now = time.monotonic()
+            lease = self.leases.get(name)
+            if lease is None or lease[1] <= now:
+                token = uuid.uuid4().hex
+                self.leases[name] = (token, now + ttl)
+                return token
+            if now >= deadline:
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    async def release(self, name: str, token: str) -> None:
+        """
+        Releases a lock if it is still held with the given token
+
+        Args:
+            name (str): Lock name
+            token (str): Token returned by acquire
+        """
+        lease = self.leases.get(name)
+        if lease is not None and lease[0] == token:
+            del self.leases[name]
+
+    async def extend(self, name: str, token: str, ttl: float) -> bool:
+        """
+        Makes a lock expire ttl seconds from now if it is still held with the given token
+
+        Args:
+            name (str): Lock name
+            token (str): Token returned by acquire
+            ttl (float): New time in seconds until the lock expires
+
+        Returns:
+            bool: True if the lock was extended, False if it expired or was taken by someone else
+        """
+        now = time.monotonic()
+        lease = self.leases.get(name)
+        if lease is None or lease[0] != token or lease[1] <= now:
+            return False
+        self.leases[name] = (token, now + ttl)
+        return True
+
+class RedisLockManager(LockManager):
+    """
+    Locks shared by all bot instances through Redis
+
+    A lock is a key set with NX and an expiration, holding a random token so
+    that an instance whose lock expired cannot release a lock taken by another one.
+    """
+
+    def __init__(self, client: Any, prefix: str = "stickers:lock:", poll_interval: float = 0.05):
+        """
+        Initializes the lock manager
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            prefix (str): Prefix of lock keys
+            poll_interval (float): Initial pause in seconds between attempts to take a busy lock
+        """
+        self.client = client
+        self.prefix = prefix
+        self.poll_interval = poll_interval
+
+    @traced("locks.acquire", attributes=lambda self, name, ttl, wait: {"lock": name})
+    async def acquire(self, name: str, ttl: float, wait: float) -> Optional[str]:
+        """
+        Acquires a lock that expires after ttl seconds
+
+        Args:
+            name (str): Lock name
+            ttl (float): Time in seconds after which the lock is released automatically
+            wait (float): Longest time in seconds to wait for a busy lock
+
+        Returns:
+            Optional[str]: Token of the lock or None if it stayed busy
+        """
+        key = f"{self.prefix}{name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        delay = self.poll_interval
+        while True:
+            if await asyncio.to_thread(self.client.set, key, token, nx=True, px=max(int(ttl * 1000), 1)):
+                return token
+            if time.monotonic() >= deadline:
+                if wait > 0:
+                    logger.warning(f"Timed out waiting for lock {name}")
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _release(self, key: str, token: str) -> None:
+        """Deletes the lock key only if it still holds the token"""
+        from redis.exceptions import WatchError
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != token:
+                    pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+            except WatchError:
+                # The lock expired and was taken by someone else meanwhile
+                pass
+
+    async def release(self, name: str, token: str) -> None:
+        """
+        Releases a lock if it is still held with the given token
+
+        Args:
+            name (str): Lock name
+            token (str): Token returned by acquire
+        """
+        await asyncio.to_thread(self._release, f"{self.prefix}{name}", token)
+
+    def _extend(self, key: str, token: str, ttl: float) -> bool:
+        """Sets a new expiration of the lock key only if it still holds the token"""
+        from redis.exceptions import WatchError
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != token:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.pexpire(key, max(int(ttl * 1000), 1))
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def extend(self, name: str, token: str, ttl: float) -> bool:
+        """
+        Makes a lock expire ttl seconds from now if it is still held with the given token
+
+        Args:
+            name (str): Lock name
+            token (str): Token returned by acquire
+            ttl (float): New time in seconds until the lock expires
+
+        Returns:
+            bool: True if the lock was extended, False if it expired or was taken by someone else
+        """
+        return await asyncio.to_thread(self._extend, f"{self.prefix}{name}", token, ttl)
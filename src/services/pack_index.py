@@ -0,0 +1,123 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from src.interfaces import StickerStorage
+
+logger = logging.getLogger(__name__)
+
+class PackIndex:
+    """Per-user index of sticker packs ordered by recent use, with cached keyboard pages"""
+
+    def __init__(
+        self,
+        sticker_storage: StickerStorage,
+        page_size: int = 8,
+        max_cached_users: int = 10000,
+        on_invalidate: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Initializes the pack index
+
+        Args:
+            sticker_storage (StickerStorage): Sticker pack data storage
+            page_size (int): Number of packs on one page
+            max_cached_users (int): Number of users whose index is kept in memory
+            on_invalidate (Optional[Callable[[str], None]]): Called with the user ID after a local
+                change of user's packs, e.g. to notify other bot instances
+        """
+        self.sticker_storage = sticker_storage
+        self.page_size = page_size
+        self.max_cached_users = max_cached_users
+        self.on_invalidate = on_invalidate
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_entry(self, user_id: str) -> Dict:
+        """
+        Returns the cached index of a user, building it from storage if needed
+
+        Args:
+            user_id (str): User ID
+
+        Returns:
+            Dict: Index with packs ordered by recent use, packs by ID and cached pages
+        """
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                self.entries.move_to_end(user_id)
+                return entry
+
+        packs = self.sticker_storage.get_user_packs(user_id)
+        order = sorted(
+            ((pack["id"], pack_name, pack.get("name", pack_name), pack.get("last_used", 0.0))
+             for pack_name, pack in packs.items()),
+            key=lambda item: item[3],
+            reverse=True
+        )
+        entry = {
+            "order": [(pack_id, display_name) for pack_id, _, display_name, _ in order],
+            "by_id": {pack_id: pack_name for pack_id, pack_name, _, _ in order},
+            "pages": {}
+        }
+
+        with self.lock:
+            self.entries[user_id] = entry
+            if len(self.entries) > self.max_cached_users:
+                self.entries.popitem(last=False)
+        return entry
+
+    def get_page(self, user_id: str, page: int) -> Tuple[List[Tuple[int, str]], int, int]:
+        """
+        Gets one page of user's packs, most recently used first
+
+        Args:
+            user_id (str): User ID
+            page (int): Page number starting from 0, clamped to the existing pages
+
+        Returns:
+            Tuple[List[Tuple[int, str]], int, int]: ((Pack ID, Display name) items, Page number, Total pages)
+        """
+        entry = self._get_entry(user_id)
+        total_pages = (len(entry["order"]) + self.page_size - 1) // self.page_size
+        page = min(max(page, 0), max(total_pages - 1, 0))
+
+        items = entry["pages"].get(page)
+        if items is None:
+            start = page * self.page_size
+            items = entry["order"][start:start + self.page_size]
+            entry["pages"][page] = items
+        return items, page, total_pages
+
+    def resolve(self, user_id: str, pack_id: int) -> Optional[str]:
+        """
+        Gets the sticker set name by its short ID
+
+        Args:
+            user_id (str): User ID
+            pack_id (int): Short pack ID
+
+        Returns:
+            Optional[str]: Sticker set name or None if the pack does not exist
+        """
+        return self._get_entry(user_id)["by_id"].get(pack_id)
+
+    def invalidate(self, user_id: str, notify: bool = True) -> None:
+        """
+        Drops the cached index of a user after their packs changed
+
+        Args:
+            user_id (str): User ID
+            notify (bool): Whether to pass the change on to on_invalidate, False for
+                changes reported by other instances
+        """
+        with self.lock:
+            self.entries.pop(user_id, None)
+        if notify and self.on_invalidate:
+            self.on_invalidate(user_id)
+
+    def clear(self) -> None:
+        """Drops the cached indexes of all users"""
+        with self.lock:
+            self.entries.clear()
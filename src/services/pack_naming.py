@@ -0,0 +1,229 @@
+import re
+import time
+import asyncio
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+from src.interfaces import TelegramClient
+from src.tracing import traced, set_span_attributes
+
+logger = logging.getLogger(__name__)
+
+MAX_NAME_LENGTH = 64
+
+_TRANSLITERATION = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "і": "i", "ї": "yi", "є": "ye", "ґ": "g", "ў": "u"
+}
+
+_INVALID_CHARS = re.compile(r"[^a-z0-9]+")
+
+def transliterate(text: str) -> str:
+    """
+    Converts Cyrillic letters to Latin ones
+
+    Args:
+        text (str): Source text
+
+    Returns:
+        str: Lowercase text with Cyrillic letters replaced
+    """
+    return "".join(_TRANSLITERATION.get(char, char) for char in text.lower())
+
+def is_name_taken_error(message: str) -> bool:
+    """
+    Checks if a failed createNewStickerSet call was rejected because the name is taken
+
+    Args:
+        message (str): Error message of the call
+
+    Returns:
+        bool: True if the sticker set name is already in use
+    """
+    # Telegram reports "sticker set name is already occupied", older versions said "taken"
+    return "name is already occupied" in message or "name is already taken" in message
+
+def sanitize_pack_name(display_name: str, bot_username: str, max_length: int = MAX_NAME_LENGTH) -> str:
+    """
+    Builds a sticker set name satisfying Telegram rules from a display name:
+    only Latin letters, digits and single underscores, starts with a letter,
+    ends with _by_<bot username> and is at most 64 characters long
+
+    Args:
+        display_name (str): Pack name typed by the user
+        bot_username (str): Username of the bot without @
+        max_length (int): Maximum length of the name
+
+    Returns:
+        str: Valid sticker set name
+    """
+    suffix = f"_by_{bot_username.lower()}"
+    base = _INVALID_CHARS.sub("_", transliterate(display_name)).strip("_")
+    if not base or not base[0].isalpha():
+        base = f"pack_{base}" if base else "pack"
+    base = base[:max_length - len(suffix)].rstrip("_")
+    return base + suffix
+
+class PackNamer:
+    """
+    Picks a free sticker set name before the first sticker is uploaded
+
+    Several candidate names are checked concurrently with getStickerSet,
+    names found to be taken are remembered, so repeated names are not probed again.
+    """
+
+    def __init__(
+        self,
+        telegram_client: TelegramClient,
+        bot_username: str = "genstickerbot",
+        candidates_per_round: int = 4,
+        max_rounds: int = 2,
+        max_cached_names: int = 10000,
+        probe_timeout: float = 5.0
+    ):
+        """
+        Initializes the namer
+
+        Args:
+            telegram_client (TelegramClient): Telegram API client
+            bot_username (str): Username of the bot, sticker set names must end with it
+            candidates_per_round (int): Number of names checked concurrently
+            max_rounds (int): Number of candidate rounds before giving up
+            max_cached_names (int): Number of remembered taken names
+            probe_timeout (float): Time in seconds to wait for all checks of a round
+        """
+        self.telegram_client = telegram_client
+        self.bot_username = bot_username
+        self.candidates_per_round = candidates_per_round
+        self.max_rounds = max_rounds
+        self.max_cached_names = max_cached_names
+        self.probe_timeout = probe_timeout
+        self.taken: "OrderedDict[str, float]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def is_known_taken(self, name: str) -> bool:
+        """
+        Checks if a name is remembered as taken
+
+        Args:
+            name (str): Sticker set name
+
+        Returns:
+            bool: True if the name is known to be taken
+        """
+        key = name.lower()
+        with self.lock:
+            if key in self.taken:
+                self.taken.move_to_end(key)
+                return True
+        return False
+
+    def mark_taken(self, name: str) -> None:
+        """
+        Remembers a taken name, e.g. after Telegram rejected it
+
+        Args:
+            name (str): Sticker set name
+        """
+        with self.lock:
+            self.taken[name.lower()] = time.time()
+            self.taken.move_to_end(name.lower())
+            while len(self.taken) > self.max_cached_names:
+                self.taken.popitem(last=False)
+
+    def _with_tag(self, base_name: str, tag: str) -> str:
+        """Inserts a tag before the _by_<bot> suffix, keeping the name within the length limit"""
+        suffix = f"_by_{self.bot_username.lower()}"
+        base = base_name[:-len(suffix)]
+        tag = f"_{tag}"
+        return base[:MAX_NAME_LENGTH - len(suffix) - len(tag)].rstrip("_") + tag + suffix
+
+    def candidates(self, display_name: str, user_id: str, round_number: int = 0) -> List[str]:
+        """
+        Generates candidate names for a pack, the plain name first
+
+        Args:
+            display_name (str): Pack name typed by the user
+            user_id (str): User ID, used to make names of different users distinct
+            round_number (int): Number of the round, later rounds use random tags only
+
+        Returns:
+            List[str]: Candidate names in order of preference
+        """
+        base_name = sanitize_pack_name(display_name, self.bot_username)
+        names = []
+        if round_number == 0:
+            names = [base_name, self._with_tag(base_name, str(user_id)[-4:])]
+        while len(names) < self.candidates_per_round:
+            names.append(self._with_tag(base_name, secrets.token_hex(2)))
+        return names
+
+    async def _probe(self, name: str) -> Optional[bool]:
+        """
+        Checks if a name is free
+
+        Returns:
+            Optional[bool]: True if free, False if taken, None if unknown
+        """
+        info, exists = await self.telegram_client.lookup_sticker_set(name)
+        if not exists:
+            return True
+        if info is not None:
+            self.mark_taken(name)
+            return False
+        return None
+
+    @traced("pack_namer.allocate")
+    async def allocate(self, display_name: str, user_id: str, exclude: Iterable[str] = ()) -> str:
+        """
+        Picks the most preferred free name for a new pack
+
+        When Telegram can't be reached, the first candidate not known to be taken is returned
+        unchecked and the upload decides.
+
+        Args:
+            display_name (str): Pack name typed by the user
+            user_id (str): User ID
+            exclude (Iterable[str]): Names that must not be returned
+
+        Returns:
+            str: Sticker set name
+        """
+        excluded = {name.lower() for name in exclude}
+        fallback = None
+        probes = 0
+        for round_number in range(self.max_rounds):
+            names = [
+                name for name in dict.fromkeys(self.candidates(display_name, user_id, round_number))
+                if name.lower() not in excluded and not self.is_known_taken(name)
+            ]
+            if not names:
+                continue
+            probes += len(names)
+
+            try:
+                results = await asyncio.wait_for(
+                    asyncio.gather(*(self._probe(name) for name in names), return_exceptions=True),
+                    self.probe_timeout
+                )
+            except asyncio.TimeoutError:
+                results = [None] * len(names)
+
+            for name, result in zip(names, results):
+                if result is True:
+                    set_span_attributes(probes=probes, rounds=round_number + 1)
+                    return name
+                if fallback is None and (result is None or isinstance(result, Exception)):
+                    fallback = name
+
+        set_span_attributes(probes=probes, rounds=self.max_rounds, unchecked=True)
+        if fallback is not None:
+            logger.warning(f"Could not check sticker set names for '{display_name}', trying {fallback} unchecked")
+            return fallback
+        # Everything taken, a random tag is practically always free
+        return self._with_tag(sanitize_pack_name(display_name, self.bot_username), secrets.token_hex(4))
@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Union
+from src.interfaces import StickerStorage, TelegramClient, LockManager
+from src.services.locks import STICKER_SET_LOCK_TTL
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Token bucket limiting the rate of background API requests"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initializes the rate limiter
+
+        Args:
+            rate (float): Allowed requests per second
+            burst (int): Number of requests that may be sent at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a request is allowed"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class FileCheckpointStore:
+    """Reconciliation progress in a local JSON file, for a single bot instance"""
+
+    def __init__(self, file_path: str):
+        """
+        Initializes the checkpoint store
+
+        Args:
+            file_path (str): Path to the checkpoint file
+        """
+        self.file_path = file_path
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Loads the checkpoint
+
+        Returns:
+            Dict[str, Any]: Checkpoint fields, empty if there is none
+        """
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            logger.error(f"Error reading reconciler checkpoint {self.file_path}")
+            return {}
+
+    def save(self, checkpoint: Dict[str, Any]) -> None:
+        """
+        Saves the checkpoint, replacing the file atomically
+
+        Args:
+            checkpoint (Dict[str, Any]): Checkpoint fields
+        """
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.file_path)
+
+class RedisCheckpointStore:
+    """
+    Reconciliation progress shared by all bot instances through Redis
+
+    The instance holding the lease of the next interval resumes the pass
+    where the previous holder stopped and sees when the last pass completed.
+    """
+
+    def __init__(self, client: Any, key: str = "stickers:reconciler_checkpoint"):
+        """
+        Initializes the checkpoint store
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            key (str): Key of the checkpoint
+        """
+        self.client = client
+        self.key = key
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Loads the checkpoint
+
+        Returns:
+            Dict[str, Any]: Checkpoint fields, empty if there is none
+        """
+        value = self.client.get(self.key)
+        if value is None:
+            return {}
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            logger.error(f"Error reading reconciler checkpoint {self.key}")
+            return {}
+
+    def save(self, checkpoint: Dict[str, Any]) -> None:
+        """
+        Saves the checkpoint
+
+        Args:
+            checkpoint (Dict[str, Any]): Checkpoint fields
+        """
+        self.client.set(self.key, json.dumps(checkpoint))
+
+class PackReconciler:
+    """Background task syncing stored sticker packs with their real state in Telegram"""
+
+    def __init__(
+        self,
+        sticker_storage: StickerStorage,
+        telegram_client: TelegramClient,
+        checkpoint_store: Union[FileCheckpointStore, RedisCheckpointStore],
+        on_user_changed: Optional[Callable[[str], None]] = None,
+        is_busy: Optional[Callable[[], bool]] = None,
+        lock_manager: Optional[LockManager] = None,
+        max_concurrency: int = 4,
+        requests_per_second: float = 5.0,
+        users_per_step: int = 20,
+        pass_interval: float = 3600.0,
+        max_busy_wait: float = 30.0
+    ):
+        """
+        Initializes the reconciler
+
+        Args:
+            sticker_storage (StickerStorage): Sticker pack data storage
+            telegram_client (TelegramClient): Telegram API client
+            checkpoint_store (Union[FileCheckpointStore, RedisCheckpointStore]): Storage of the progress of
+                the current pass and the completion time of the last one, shared in Redis by several instances
+            on_user_changed (Optional[Callable[[str], None]]): Called with the user ID after
+                the user's packs were updated or pruned
+            is_busy (Optional[Callable[[], bool]]): Returns True while interactive requests are running
+            lock_manager (Optional[LockManager]): Locks shared between bot instances, a pass runs
+                only on the instance holding the reconciliation lease of the current interval
+            max_concurrency (int): Maximum number of simultaneous getStickerSet requests
+            requests_per_second (float): Rate budget for getStickerSet requests
+            users_per_step (int): Number of users processed between checkpoints
+            pass_interval (float): Pause in seconds between full passes
+            max_busy_wait (float): Longest time in seconds a step waits for interactive traffic to stop
+        """
+        self.sticker_storage = sticker_storage
+        self.telegram_client = telegram_client
+        self.checkpoint_store = checkpoint_store
+        self.on_user_changed = on_user_changed
+        self.is_busy = is_busy
+        self.lock_manager = lock_manager
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.users_per_step = users_per_step
+        self.pass_interval = pass_interval
+        self.max_busy_wait = max_busy_wait
+        self.lease_token: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Starts the background reconciliation loop"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the background reconciliation loop"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self) -> None:
+        """Runs reconciliation passes forever, pass_interval after the completion of the previous one"""
+        while True:
+            delay = await asyncio.to_thread(self._seconds_until_next_pass)
+            if delay > 0:
+                logger.info(f"Next pack reconciliation pass in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+            completed = False
+            try:
+                if await self._acquire_lease():
+                    completed = await self.run_pass()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error reconciling sticker packs")
+
+            if not completed:
+                # Failed or skipped in favor of another instance, try again after the interval
+                await asyncio.sleep(self.pass_interval)
+
+    def _seconds_until_next_pass(self) -> float:
+        """
+        Computes the time until the next pass is due, so restarts don't start a new pass at once
+
+        Returns:
+            float: Seconds to wait, 0 if an interrupted pass should be resumed or no pass ever completed
+        """
+        checkpoint = self._load_checkpoint()
+        completed_at = checkpoint.get("completed_at")
+        if checkpoint.get("last_user_id") is not None or completed_at is None:
+            return 0.0
+        return max(0.0, completed_at + self.pass_interval - time.time())
+
+    async def _acquire_lease(self) -> bool:
+        """
+        Takes the lease for one pass. It is renewed after every step and not released,
+        so it expires one pass interval after the last step
+
+        Returns:
+            bool: True if this instance should run the pass
+        """
+        if self.lock_manager is None:
+            return True
+        self.lease_token = await self.lock_manager.acquire("pack_reconciler", self.pass_interval, 0.0)
+        if self.lease_token is None:
+            logger.info("Pack reconciliation is running on another instance, skipping pass")
+        return self.lease_token is not None
+
+    async def _renew_lease(self) -> bool:
+        """
+        Extends the lease, so a pass longer than the pass interval doesn't overlap with another instance
+
+        Returns:
+            bool: False if the lease was lost and the pass must stop
+        """
+        if self.lock_manager is None or self.lease_token is None:
+            return True
+        return await self.lock_manager.extend("pack_reconciler", self.lease_token, self.pass_interval)
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        """
+        Loads the reconciliation progress
+
+        Returns:
+            Dict[str, Any]: "last_user_id" of the interrupted pass or None if a new pass should start,
+                "completed_at" timestamp of the last completed pass or None
+        """
+        return self.checkpoint_store.load()
+
+    def _save_checkpoint(self, last_user_id: Optional[str], completed_at: Optional[float]) -> None:
+        """
+        Saves the reconciliation progress
+
+        Args:
+            last_user_id (Optional[str]): Last processed user ID or None when the pass is complete
+            completed_at (Optional[float]): Timestamp of the last completed pass
+        """
+        self.checkpoint_store.save({"last_user_id": last_user_id, "completed_at": completed_at, "updated_at": time.time()})
+
+    async def _wait_until_idle(self) -> None:
+        """Yields to interactive traffic for a bounded time"""
+        if self.is_busy is None:
+            return
+        deadline = time.monotonic() + self.max_busy_wait
+        while self.is_busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+    async def run_pass(self) -> bool:
+        """
+        Walks all users once, continuing after the checkpoint of an interrupted pass
+
+        Returns:
+            bool: True if the pass completed, False if it stopped after losing the lease
+        """
+        checkpoint = self._load_checkpoint()
+        cursor = checkpoint.get("last_user_id")
+        completed_at = checkpoint.get("completed_at")
+        user_ids = sorted(await asyncio.to_thread(self.sticker_storage.get_user_ids))
+        if cursor is not None:
+            user_ids = [user_id for user_id in user_ids if user_id > cursor]
+            logger.info(f"Resuming pack reconciliation after user {cursor}")
+
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        for start in range(0, len(user_ids), self.users_per_step):
+            step = user_ids[start:start + self.users_per_step]
+            await self._wait_until_idle()
+            await asyncio.gather(*(self._reconcile_user(user_id, semaphore) for user_id in step))
+            await asyncio.to_thread(self._save_checkpoint, step[-1], completed_at)
+            if not await self._renew_lease():
+                logger.warning("Pack reconciliation lease expired, leaving the rest of the pass to another instance")
+                return False
+
+        await asyncio.to_thread(self._save_checkpoint, None, time.time())
+        logger.info(f"Reconciled packs of {len(user_ids)} users in {time.monotonic() - started:.1f}s")
+        return True
+
+    async def _reconcile_user(self, user_id: str, semaphore: asyncio.Semaphore) -> None:
+        """
+        Syncs all packs of one user
+
+        Args:
+            user_id (str): User ID
+            semaphore (asyncio.Semaphore): Limits concurrent requests of the pass
+        """
+        packs = await asyncio.to_thread(self.sticker_storage.get_user_packs, user_id)
+        results = await asyncio.gather(*(self._reconcile_pack(user_id, pack_name, semaphore) for pack_name in packs))
+        if any(results) and self.on_user_changed:
+            # Invalidations may be network round trips, they run off the event loop
+            await asyncio.to_thread(self.on_user_changed, user_id)
+
+    async def _reconcile_pack(self, user_id: str, pack_name: str, semaphore: asyncio.Semaphore) -> bool:
+        """
+        Syncs one pack within the concurrency and rate budget
+
+        The sticker set lock is held from the request until the pack is stored,
+        so a sticker added meanwhile is not overwritten by an older snapshot.
+        Sets locked by an upload are skipped until the next pass.
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker set name
+            semaphore (asyncio.Semaphore): Limits concurrent requests of the pass
+
+        Returns:
+            bool: True if the stored pack changed
+        """
+        async with semaphore:
+            await self.rate_limiter.acquire()
+            token = None
+            if self.lock_manager is not None:
+                token = await self.lock_manager.acquire(f"sticker_set:{pack_name}", STICKER_SET_LOCK_TTL, 0.0)
+                if token is None:
+                    logger.info(f"Sticker set {pack_name} is being changed, reconciling it in the next pass")
+                    return False
+            try:
+                info, exists = await self.telegram_client.lookup_sticker_set(pack_name)
+                # Storage writes may be network round trips, they run off the event loop
+                return await asyncio.to_thread(self._apply_result, user_id, pack_name, info, exists)
+            finally:
+                if token is not None:
+                    await self.lock_manager.release(f"sticker_set:{pack_name}", token)
+
+    def _apply_result(self, user_id: str, pack_name: str, info: Optional[Dict[str, Any]], exists: bool) -> bool:
+        """
+        Stores the state of a pack received from Telegram
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker set name
+            info (Optional[Dict[str, Any]]): Sticker set info, None if it could not be requested
+            exists (bool): False if the sticker set was deleted
+
+        Returns:
+            bool: True if the stored pack changed
+        """
+        if not exists:
+            logger.info(f"Pruning deleted sticker pack {pack_name} of user {user_id}")
+            self.sticker_storage.remove_pack(user_id, pack_name)
+            return True
+        if info is None:
+            return False
+
+        pack = self.sticker_storage.get_user_packs(user_id).get(pack_name)
+        if pack is None:
+            return False
+        file_ids = [sticker["file_id"] for sticker in info.get("stickers", [])]
+        known = set(file_ids)
+        # Most packs are unchanged, only real changes invalidate cached pages
+        return self.sticker_storage.update_pack_info(user_id, pack_name, {
+            "name": info.get("title", pack_name),
+            "sticker_type": info.get("sticker_type", "regular"),
+            "sticker_count": len(file_ids),
+            "file_ids": file_ids,
+            # Earlier passes stored file IDs in the sticker info list, they are moved out of it
+            "stickers": [entry for entry in pack.get("stickers", []) if entry not in known]
+        })
@@ -0,0 +1,208 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from src.interfaces import StickerStorage
+from src.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+class RedisStickerStorage(StickerStorage):
+    """
+    Sticker pack storage shared by all bot instances through Redis
+
+    Packs of a user are kept in one hash, field per sticker set name, value as JSON.
+    Read-modify-write operations run in WATCH/MULTI transactions that are retried
+    when another instance changed the same user meanwhile, so no write is lost.
+    """
+
+    def __init__(self, client: Any, prefix: str = "stickers:"):
+        """
+        Initializes the sticker pack storage
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            prefix (str): Prefix of storage keys
+        """
+        self.client = client
+        self.prefix = prefix
+        self.users_key = f"{prefix}users"
+
+    def _user_key(self, user_id: str) -> str:
+        """Returns the key of the hash with packs of a user"""
+        return f"{self.prefix}packs:{user_id}"
+
+    def _pack_id_key(self, user_id: str) -> str:
+        """Returns the key of the last pack ID assigned to a user, it outlives removed packs"""
+        return f"{self.prefix}pack_ids:{user_id}"
+
+    def get_user_packs(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        return {
+            pack_name: json.loads(value)
+            for pack_name, value in self.client.hgetall(self._user_key(user_id)).items()
+        }
+
+    @traced("redis_storage.add_sticker_to_pack")
+    def add_sticker_to_pack(self, user_id: str, pack_name: str, sticker_info: str) -> None:
+        """
+        Adds sticker information to a user's pack
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+            sticker_info (str): Information about the sticker
+        """
+        key = self._user_key(user_id)
+
+        def update(pipe) -> None:
+            value = pipe.hget(key, pack_name)
+            if value is None:
+                raise ValueError(f"Sticker pack {pack_name} does not exist for user {user_id}")
+            pack = json.loads(value)
+            pack.setdefault("stickers", []).append(sticker_info)
+            pack["last_used"] = time.time()
+            pipe.multi()
+            pipe.hset(key, pack_name, json.dumps(pack, ensure_ascii=False))
+
+        self.client.transaction(update, key)
+
+    @traced("redis_storage.create_pack")
+    def create_pack(self, user_id: str, pack_name: str, display_name: str) -> None:
+        """
+        Creates a new sticker pack for a user
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): System sticker pack name
+            display_name (str): Display name for the sticker pack
+        """
+        key = self._user_key(user_id)
+        id_key = self._pack_id_key(user_id)
+
+        def create(pipe) -> None:
+            # The ID is computed inside the transaction, so concurrent creations get distinct IDs.
+            # IDs only grow, so buttons of a removed pack never point to another one
+            last_id = pipe.get(id_key)
+            if last_id is None:
+                # Users imported or created before the counter existed
+                packs = [json.loads(value) for value in pipe.hvals(key)]
+                last_id = max((pack.get("id", 0) for pack in packs), default=0)
+            pack_id = int(last_id) + 1
+            pipe.multi()
+            pipe.set(id_key, pack_id)
+            pipe.hset(key, pack_name, json.dumps({
+                "id": pack_id,
+                "name": display_name,
+                "stickers": [],
+                "last_used": time.time()
+            }, ensure_ascii=False))
+            pipe.sadd(self.users_key, user_id)
+
+        self.client.transaction(create, key, id_key)
+
+    def get_user_ids(self) -> List[str]:
+        """
+        Gets IDs of all users with stored sticker packs
+
+        Returns:
+            List[str]: User IDs
+        """
+        return list(self.client.smembers(self.users_key))
+
+    def update_pack_info(self, user_id: str, pack_name: str, info: Dict[str, Any]) -> bool:
+        """
+        Updates stored pack fields, the pack is written only if something changed
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+            info (Dict[str, Any]): Fields to update
+
+        Returns:
+            bool: True if any field changed
+        """
+        key = self._user_key(user_id)
+
+        def update(pipe) -> bool:
+            value = pipe.hget(key, pack_name)
+            if value is None:
+                return False
+            pack = json.loads(value)
+            if all(pack.get(field) == field_value for field, field_value in info.items()):
+                return False
+            pack.update(info)
+            pipe.multi()
+            pipe.hset(key, pack_name, json.dumps(pack, ensure_ascii=False))
+            return True
+
+        return self.client.transaction(update, key, value_from_callable=True)
+
+    def remove_pack(self, user_id: str, pack_name: str) -> None:
+        """
+        Removes a sticker pack of a user, users without packs are dropped from the user set
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+        """
+        key = self._user_key(user_id)
+
+        def remove(pipe) -> None:
+            remaining = pipe.hkeys(key)
+            pipe.multi()
+            pipe.hdel(key, pack_name)
+            if not [name for name in remaining if name != pack_name]:
+                pipe.srem(self.users_key, user_id)
+
+        self.client.transaction(remove, key)
+
+    def save(self) -> None:
+        """Does nothing, every change is written to Redis immediately"""
+
+    def has_pack(self, user_id: str, pack_name: str) -> bool:
+        """
+        Checks if a sticker pack exists for a user
+
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+
+        Returns:
+            bool: True if the sticker pack exists
+        """
+        return bool(self.client.hexists(self._user_key(user_id), pack_name))
+
+    def import_data(
+        self,
+        data: Dict[str, Dict[str, Dict[str, Any]]],
+        last_pack_ids: Optional[Dict[str, int]] = None
+    ) -> bool:
+        """
+        Imports packs of a local JSON storage once, the first instance to start wins
+
+        Args:
+            data (Dict[str, Dict[str, Dict[str, Any]]]): Packs by user ID and sticker set name
+            last_pack_ids (Optional[Dict[str, int]]): Last assigned pack ID by user ID
+
+        Returns:
+            bool: True if the data was imported by this call
+        """
+        imported_key = f"{self.prefix}imported"
+        if self.client.exists(imported_key):
+            return False
+
+        # The flag is set in the same MULTI as the data, so a failed import is retried on the next start.
+        # Instances importing at the same time write the same data, packs and counters are only set if missing
+        pipe = self.client.pipeline(transaction=True)
+        for user_id, packs in data.items():
+            for pack_name, pack in packs.items():
+                # Packs created by other instances in the meantime are kept
+                pipe.hsetnx(self._user_key(user_id), pack_name, json.dumps(pack, ensure_ascii=False))
+            pipe.sadd(self.users_key, user_id)
+        for user_id, last_id in (last_pack_ids or {}).items():
+            pipe.set(self._pack_id_key(user_id), last_id, nx=True)
+        pipe.set(imported_key, time.time(), nx=True)
+        if not pipe.execute()[-1]:
+            return False
+        logger.info(f"Imported sticker packs of {len(data)} users into Redis")
+        return True
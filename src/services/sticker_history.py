@@ -0,0 +1,285 @@
+from __future__ import annotations
+import time
+import sqlite3
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+# NumPy and Pillow are imported on first use, so they don't slow down startup
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+@functools.lru_cache(maxsize=None)
+def _dct_matrix(size: int) -> np.ndarray:
+    """Builds the orthonormal DCT-II matrix"""
+    import numpy as np
+
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    Computes a 64-bit DCT perceptual hash, similar images have hashes with few differing bits
+
+    Args:
+        image (Image.Image): Image, transparent areas are treated as white
+
+    Returns:
+        int: Unsigned 64-bit hash
+    """
+    import numpy as np
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA", "P"):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba)
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+
+    # Low frequencies describe the overall shape and survive scaling and recompression
+    dct = _dct_matrix(_DCT_SIZE)
+    low = (dct @ pixels @ dct.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # The DC term is the average brightness, it is left out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def _to_signed(value: int) -> int:
+    """Converts an unsigned 64-bit hash to the signed integer SQLite can store"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """
+    Counts differing bits between many hashes and one hash
+
+    Args:
+        hashes (np.ndarray): uint64 array of hashes
+        value (int): Unsigned 64-bit hash
+
+    Returns:
+        np.ndarray: Number of differing bits for every hash
+    """
+    import numpy as np
+
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    # numpy < 2.0
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class StickerHistory:
+    """
+    History of generated stickers in a SQLite file
+
+    Only the Telegram file_id, the prompt and an 8-byte perceptual hash are stored,
+    so sent stickers can be shown again without regenerating them. Hashes of
+    recently active users are kept in memory as arrays for near-duplicate search.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        duplicate_distance: int = 6,
+        max_entries_per_user: int = 5000,
+        max_cached_users: int = 10000
+    ):
+        """
+        Initializes the history
+
+        Args:
+            file_path (str): Path to the SQLite database file
+            duplicate_distance (int): Maximum number of differing hash bits of near-duplicates
+            max_entries_per_user (int): Number of latest stickers of a user searched for duplicates
+            max_cached_users (int): Number of users whose hashes are kept in memory
+        """
+        self.file_path = file_path
+        self.duplicate_distance = duplicate_distance
+        self.max_entries_per_user = max_entries_per_user
+        self.max_cached_users = max_cached_users
+        self.connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.connection_lock = threading.Lock()
+        self.cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        """Creates database tables if they don't exist"""
+        with self.connection_lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS stickers ("
+                "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, created_at REAL NOT NULL, "
+                "phash INTEGER NOT NULL, file_id TEXT NOT NULL, prompt TEXT, pack_name TEXT)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS stickers_user ON stickers (user_id, id)"
+            )
+
+    def _load_user(self, user_id: int) -> Dict[str, Any]:
+        """Returns cached hashes of a user's latest stickers, loading them if needed"""
+        import numpy as np
+
+        with self.cache_lock:
+            entry = self.cache.get(user_id)
+            if entry is not None:
+                self.cache.move_to_end(user_id)
+                return entry
+
+        with self.connection_lock:
+            rows = self.connection.execute(
+                "SELECT id, phash, pack_name FROM stickers WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, self.max_entries_per_user)
+            ).fetchall()
+        entry = {
+            "ids": np.array([row[0] for row in rows], dtype=np.int64),
+            "hashes": np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64),
+            "packs": [row[2] for row in rows]
+        }
+
+        with self.cache_lock:
+            self.cache[user_id] = entry
+            while len(self.cache) > self.max_cached_users:
+                self.cache.popitem(last=False)
+        return entry
+
+    def _drop_cached(self, user_id: int) -> None:
+        """Forgets cached hashes of a user after a change"""
+        with self.cache_lock:
+            self.cache.pop(user_id, None)
+
+    def add(self, user_id: str, phash: int, file_id: str, prompt: Optional[str]) -> int:
+        """
+        Records a sent sticker
+
+        Args:
+            user_id (str): User ID
+            phash (int): Perceptual hash of the sticker
+            file_id (str): Telegram file ID of the sent sticker
+            prompt (Optional[str]): Description the sticker was generated from, None for photos
+
+        Returns:
+            int: ID of the history entry
+        """
+        with self.connection_lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO stickers (user_id, created_at, phash, file_id, prompt) VALUES (?, ?, ?, ?, ?)",
+                (int(user_id), time.time(), _to_signed(phash), file_id, prompt)
+            )
+        self._drop_cached(int(user_id))
+        return cursor.lastrowid
+
+    def set_pack(self, user_id: str, entry_id: int, pack_name: str) -> None:
+        """
+        Records that a sticker was added to a pack
+
+        Args:
+            user_id (str): User ID
+            entry_id (int): ID of the history entry
+            pack_name (str): Sticker set name
+        """
+        with self.connection_lock, self.connection:
+            self.connection.execute(
+                "UPDATE stickers SET pack_name = ? WHERE id = ? AND user_id = ?",
+                (pack_name, entry_id, int(user_id))
+            )
+        self._drop_cached(int(user_id))
+
+    def get(self, user_id: str, entry_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Gets a history entry of a user
+
+        Args:
+            user_id (str): User ID
+            entry_id (int): ID of the history entry
+
+        Returns:
+            Optional[Dict[str, Any]]: Entry or None if it does not exist
+        """
+        entries = self._select("WHERE id = ? AND user_id = ?", (entry_id, int(user_id)))
+        return entries[0] if entries else None
+
+    def recent(self, user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Gets the latest stickers of a user
+
+        Args:
+            user_id (str): User ID
+            limit (int): Maximum number of entries
+
+        Returns:
+            List[Dict[str, Any]]: Entries, newest first
+        """
+        return self._select("WHERE user_id = ? ORDER BY id DESC LIMIT ?", (int(user_id), limit))
+
+    def _select(self, condition: str, params: Tuple) -> List[Dict[str, Any]]:
+        """Reads entries matching a condition"""
+        with self.connection_lock:
+            rows = self.connection.execute(
+                f"SELECT id, created_at, phash, file_id, prompt, pack_name FROM stickers {condition}", params
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "created_at": row[1],
+                "phash": row[2] & ((1 << 64) - 1),
+                "file_id": row[3],
+                "prompt": row[4],
+                "pack_name": row[5]
+            }
+            for row in rows
+        ]
+
+    def find_similar(
+        self,
+        user_id: str,
+        phash: int,
+        pack_name: Optional[str] = None,
+        exclude_id: Optional[int] = None
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Finds the most similar sticker of a user
+
+        Args:
+            user_id (str): User ID
+            phash (int): Perceptual hash to compare with
+            pack_name (Optional[str]): Only search stickers added to this pack
+            exclude_id (Optional[int]): Entry that is not reported, e.g. the sticker itself
+
+        Returns:
+            Optional[Tuple[int, int]]: (Entry ID, Number of differing bits) of the closest
+                near-duplicate or None if there is none
+        """
+        import numpy as np
+
+        entry = self._load_user(int(user_id))
+        if not len(entry["ids"]):
+            return None
+
+        distances = hamming_distances(entry["hashes"], phash).astype(np.int64)
+        candidates = distances <= self.duplicate_distance
+        if pack_name is not None:
+            candidates &= np.array([pack == pack_name for pack in entry["packs"]])
+        if exclude_id is not None:
+            candidates &= entry["ids"] != exclude_id
+        if not candidates.any():
+            return None
+
+        distances = np.where(candidates, distances, np.iinfo(np.int64).max)
+        index = int(np.argmin(distances))
+        return int(entry["ids"][index]), int(distances[index])
+
+    def close(self) -> None:
+        """Closes the database"""
+        with self.connection_lock:
+            self.connection.close()
@@ -1,12 +1,31 @@
 import os
+import time
+import asyncio
+import functools
 import tempfile
 import logging
-from typing import Tuple, Dict, Any, Optional
-from PIL import Image
-from src.interfaces import ImageGenerator, ImageProcessor, StickerStorage, TelegramClient
+from io import BytesIO
+from typing import Tuple, Dict, Any, List, Optional
+from src.interfaces import ImageGenerator, ImageProcessor, StickerStorage, TelegramClient, LockManager
+from src.services.pack_index import PackIndex
+from src.services.locks import LocalLockManager, STICKER_SET_LOCK_TTL
+from src.services.pack_naming import PackNamer, is_name_taken_error
+from src.services.sticker_history import StickerHistory, perceptual_hash
+from src.tracing import traced, record_span_error
 
 logger = logging.getLogger(__name__)
 
+def _tracked(method):
+    """Counts running interactive requests so background work can yield to them"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        self.active_requests += 1
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            self.active_requests -= 1
+    return wrapper
+
 class StickerService:
     """Core service for sticker creation and management"""
     
@@ -15,7 +34,12 @@ class StickerService:
         image_generator: ImageGenerator, 
         image_processor: ImageProcessor,
         sticker_storage: StickerStorage,
-        telegram_client: TelegramClient
+        telegram_client: TelegramClient,
+        pack_index: Optional[PackIndex] = None,
+        lock_manager: Optional[LockManager] = None,
+        pack_namer: Optional[PackNamer] = None,
+        sticker_history: Optional[StickerHistory] = None,
+        max_photo_bytes: int = 10 * 1024 * 1024
     ):
         """
         Initializes the sticker management service
@@ -25,12 +49,55 @@ class StickerService:
             image_processor (ImageProcessor): Image processor
             sticker_storage (StickerStorage): Sticker pack data storage
             telegram_client (TelegramClient): Telegram API client
+            pack_index (Optional[PackIndex]): Index of user's packs for paginated selection
+            lock_manager (Optional[LockManager]): Locks serializing changes of a sticker set,
+                shared between bot instances in multi-instance deployments
+            pack_namer (Optional[PackNamer]): Picks free sticker set names for new packs
+            sticker_history (Optional[StickerHistory]): History of sent stickers, disabled if None
+            max_photo_bytes (int): Maximum size of a photo sent by a user
         """
         self.image_generator = image_generator
         self.image_processor = image_processor
         self.sticker_storage = sticker_storage
         self.telegram_client = telegram_client
+        self.pack_index = pack_index or PackIndex(sticker_storage)
+        self.lock_manager = lock_manager or LocalLockManager()
+        self.pack_namer = pack_namer or PackNamer(telegram_client)
+        self.sticker_history = sticker_history
+        self.max_photo_bytes = max_photo_bytes
+        self.max_name_attempts = 3
+        self.active_requests = 0
+    
+    def is_busy(self) -> bool:
+        """
+        Checks if interactive requests are being processed
+        
+        Returns:
+            bool: True if at least one request is running
+        """
+        return self.active_requests > 0
     
+    async def warm_up(self) -> None:
+        """
+        Loads heavy dependencies and opens connections of all services in the background
+        """
+        started = time.perf_counter()
+        logger.info("Warming up services")
+        
+        results = await asyncio.gather(
+            asyncio.to_thread(self.image_generator.warm_up),
+            asyncio.to_thread(self.image_processor.warm_up),
+            self.telegram_client.warm_up(),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Warm-up failed, dependency will be loaded on first use: {str(result)}")
+        
+        logger.info(f"Services warmed up in {time.perf_counter() - started:.2f}s")
+    
+    @_tracked
+    @traced("sticker_service.generate_sticker")
     async def generate_sticker(self, description: str) -> Tuple[bool, str, Optional[str]]:
         """
         Args:
@@ -42,25 +109,63 @@ class StickerService:
         logger.info(f"Generating sticker for description: {description}")
         
         try:
-            # Image generation
-            image = self.image_generator.generate_image(description)
+            # Image generation and processing run in worker threads, so concurrent
+            # requests don't block each other and can share rembg batches
+            image = await asyncio.to_thread(self.image_generator.generate_image, description)
             
             # Convert to sticker
-            sticker_io = self.image_processor.convert_to_sticker(image)
-            
-            # Creating sticker temp file
-            temp_file = tempfile.NamedTemporaryFile(suffix=".webp", delete=False)
-            temp_file_path = temp_file.name
+            sticker_io = await asyncio.to_thread(self.image_processor.convert_to_sticker, image)
             
-            with open(temp_file_path, "wb") as f:
-                f.write(sticker_io.getvalue())
-            
-            return True, "Стикер успешно сгенерирован", temp_file_path
+            return True, "Стикер успешно сгенерирован", self._save_temp_sticker(sticker_io)
         
         except Exception as e:
             logger.exception("Error generating sticker")
+            record_span_error(str(e))
             return False, f"Произошла ошибка при генерации стикера: {str(e)}", None
     
+    @_tracked
+    @traced("sticker_service.generate_sticker_from_photo")
+    async def generate_sticker_from_photo(self, file_id: str) -> Tuple[bool, str, Optional[str]]:
+        """
+        Creates a sticker from a photo or image document sent by the user
+        
+        Args:
+            file_id (str): Telegram file ID of the image
+            
+        Returns:
+            Tuple[bool, str, Optional[str]]: (Success status, Message, Path to temporary sticker file)
+        """
+        logger.info(f"Generating sticker from photo: {file_id}")
+        
+        success, message, data = await self.telegram_client.download_file(file_id, self.max_photo_bytes)
+        if not success:
+            record_span_error(message)
+            return False, message, None
+        
+        try:
+            sticker_io = await asyncio.to_thread(self.image_processor.convert_file_to_sticker, data)
+            return True, "Стикер успешно сгенерирован", self._save_temp_sticker(sticker_io)
+        
+        except Exception as e:
+            logger.exception("Error generating sticker from photo")
+            record_span_error(str(e))
+            return False, f"Произошла ошибка при обработке изображения: {str(e)}", None
+    
+    def _save_temp_sticker(self, sticker_io: BytesIO) -> str:
+        """
+        Writes sticker data to a temporary file
+        
+        Args:
+            sticker_io (BytesIO): Buffer with sticker data
+            
+        Returns:
+            str: Path to temporary sticker file
+        """
+        temp_file = tempfile.NamedTemporaryFile(suffix=".webp", delete=False)
+        with temp_file:
+            temp_file.write(sticker_io.getvalue())
+        return temp_file.name
+    
     def get_user_sticker_packs(self, user_id: str) -> Dict[str, Dict[str, Any]]:
         """
         Gets user's sticker packs
@@ -73,11 +178,56 @@ class StickerService:
         """
         return self.sticker_storage.get_user_packs(user_id)
     
+    async def get_pack_page(self, user_id: str, page: int) -> Tuple[List[Tuple[int, str]], int, int]:
+        """
+        Gets one page of user's sticker packs, most recently used first.
+        Building the index may read the storage, so it runs in a worker thread
+        
+        Args:
+            user_id (str): User ID
+            page (int): Page number starting from 0
+            
+        Returns:
+            Tuple[List[Tuple[int, str]], int, int]: ((Pack ID, Display name) items, Page number, Total pages)
+        """
+        return await asyncio.to_thread(self.pack_index.get_page, user_id, page)
+    
+    async def resolve_pack(self, user_id: str, pack_id: int) -> Optional[str]:
+        """
+        Gets the sticker set name by its short ID
+        
+        Args:
+            user_id (str): User ID
+            pack_id (int): Short pack ID
+            
+        Returns:
+            Optional[str]: Sticker set name or None if the pack does not exist
+        """
+        return await asyncio.to_thread(self.pack_index.resolve, user_id, pack_id)
+    
+    def _save_added_sticker(self, user_id: str, pack_name: str, display_name: Optional[str] = None) -> None:
+        """
+        Saves a sticker added to a pack and invalidates cached pages, called in a worker thread
+        because storage and invalidation may be network round trips
+        
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+            display_name (Optional[str]): Display name if the pack was just created
+        """
+        if display_name is not None:
+            self.sticker_storage.create_pack(user_id, pack_name, display_name)
+        self.sticker_storage.add_sticker_to_pack(user_id, pack_name, "✅ Добавлен")
+        self.pack_index.invalidate(user_id)
+    
+    @_tracked
+    @traced("sticker_service.add_sticker_to_pack")
     async def add_sticker_to_pack(
         self, 
         user_id: str, 
         pack_name: str, 
-        sticker_path: str
+        sticker_path: str,
+        history_id: Optional[int] = None
     ) -> Tuple[bool, str]:
         """
         Adds a sticker to an existing pack
@@ -86,6 +236,7 @@ class StickerService:
             user_id (str): User ID
             pack_name (str): Sticker pack name
             sticker_path (str): Path to sticker file
+            history_id (Optional[int]): History entry of the sticker
             
         Returns:
             Tuple[bool, str]: (Success status, Message)
@@ -95,21 +246,32 @@ class StickerService:
         if not os.path.exists(sticker_path):
             return False, "Стикер не найден"
         
-        success, message = await self.telegram_client.add_sticker_to_set(
-            user_id, pack_name, sticker_path
-        )
-        
-        if success:
-            # Adding sticker info to the storage
-            self.sticker_storage.add_sticker_to_pack(user_id, pack_name, "✅ Добавлен")
+        try:
+            # Another instance may be changing the same set, Telegram requests are serialized per set
+            async with self.lock_manager.lock(f"sticker_set:{pack_name}", ttl=STICKER_SET_LOCK_TTL):
+                success, message = await self.telegram_client.add_sticker_to_set(
+                    user_id, pack_name, sticker_path
+                )
+                
+                if success:
+                    # Adding sticker info to the storage
+                    await asyncio.to_thread(self._save_added_sticker, user_id, pack_name)
+                    await self._record_pack(user_id, history_id, pack_name)
+                else:
+                    record_span_error(message)
+        except TimeoutError:
+            return False, "Стикерпак сейчас изменяется, попробуйте ещё раз"
         
         return success, message
     
+    @_tracked
+    @traced("sticker_service.create_new_pack")
     async def create_new_pack(
         self, 
         user_id: str, 
         display_name: str, 
-        sticker_path: str
+        sticker_path: str,
+        history_id: Optional[int] = None
     ) -> Tuple[bool, str, str]:
         """
         Creates a new sticker pack and adds the first sticker
@@ -118,6 +280,7 @@ class StickerService:
             user_id (str): User ID
             display_name (str): Display name of the sticker pack
             sticker_path (str): Path to the first sticker file
+            history_id (Optional[int]): History entry of the sticker
             
         Returns:
             Tuple[bool, str, str]: (Success status, Message, Name of created sticker pack)
@@ -127,23 +290,135 @@ class StickerService:
         if not os.path.exists(sticker_path):
             return False, "Стикер не найден", ""
         
-        # Setting stickerpack name
-        sticker_set_name = f"{display_name}_by_genstickerbot"
-        # Shortening name if too long
-        if len(sticker_set_name) > 64:
-            sticker_set_name = sticker_set_name[:64]
+        # Telegram limits titles to 64 characters
+        title = display_name[:64]
+        tried: List[str] = []
         
-        success, message = await self.telegram_client.create_sticker_set(
-            user_id, sticker_set_name, display_name, sticker_path
-        )
+        # A name found free may still be taken by someone else before the upload, then another one is picked
+        for _ in range(self.max_name_attempts):
+            sticker_set_name = await self.pack_namer.allocate(display_name, user_id, exclude=tried)
+            tried.append(sticker_set_name)
+            
+            try:
+                # Two instances must not create the same set at once
+                async with self.lock_manager.lock(f"sticker_set:{sticker_set_name}", ttl=STICKER_SET_LOCK_TTL):
+                    success, message = await self.telegram_client.create_sticker_set(
+                        user_id, sticker_set_name, title, sticker_path
+                    )
+                    
+                    if success:
+                        # Saving new pack info
+                        await asyncio.to_thread(self._save_added_sticker, user_id, sticker_set_name, title)
+                        await self._record_pack(user_id, history_id, sticker_set_name)
+            except TimeoutError:
+                return False, "Стикерпак сейчас изменяется, попробуйте ещё раз", sticker_set_name
+            
+            if success or not is_name_taken_error(message):
+                break
+            logger.info(f"Sticker set name {sticker_set_name} was taken before upload, picking another")
+            self.pack_namer.mark_taken(sticker_set_name)
         
-        if success:
-            # Saving new pack info
-            self.sticker_storage.create_pack(user_id, sticker_set_name, display_name)
-            self.sticker_storage.add_sticker_to_pack(user_id, sticker_set_name, "✅ Добавлен")
+        if not success:
+            record_span_error(message)
         
         return success, message, sticker_set_name
     
+    async def record_sticker(
+        self, 
+        user_id: str, 
+        sticker_path: str, 
+        file_id: str, 
+        prompt: Optional[str]
+    ) -> Optional[int]:
+        """
+        Saves a sent sticker to the user's history
+        
+        Args:
+            user_id (str): User ID
+            sticker_path (str): Path to sticker file
+            file_id (str): Telegram file ID of the sent sticker
+            prompt (Optional[str]): Sticker description, None for stickers made from photos
+            
+        Returns:
+            Optional[int]: ID of the history entry or None if history is disabled or saving failed
+        """
+        if self.sticker_history is None:
+            return None
+        
+        def record() -> int:
+            from PIL import Image
+            
+            with Image.open(sticker_path) as image:
+                phash = perceptual_hash(image)
+            return self.sticker_history.add(user_id, phash, file_id, prompt)
+        
+        try:
+            return await asyncio.to_thread(record)
+        except Exception as e:
+            logger.error(f"Failed to save sticker to history: {str(e)}")
+            return None
+    
+    async def _record_pack(self, user_id: str, history_id: Optional[int], pack_name: str) -> None:
+        """Saves the pack a sticker was added to, history errors don't fail the request"""
+        if self.sticker_history is None or history_id is None:
+            return
+        try:
+            await asyncio.to_thread(self.sticker_history.set_pack, user_id, history_id, pack_name)
+        except Exception as e:
+            logger.error(f"Failed to save sticker pack to history: {str(e)}")
+    
+    async def find_duplicate_in_pack(
+        self, 
+        user_id: str, 
+        pack_name: str, 
+        history_id: Optional[int]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Finds a near-identical sticker already added to a pack
+        
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+            history_id (Optional[int]): History entry of the sticker about to be added
+            
+        Returns:
+            Optional[Dict[str, Any]]: History entry of the similar sticker or None
+        """
+        if self.sticker_history is None or history_id is None:
+            return None
+        
+        def find() -> Optional[Dict[str, Any]]:
+            entry = self.sticker_history.get(user_id, history_id)
+            if entry is None:
+                return None
+            match = self.sticker_history.find_similar(user_id, entry["phash"], pack_name, exclude_id=history_id)
+            return None if match is None else self.sticker_history.get(user_id, match[0])
+        
+        try:
+            return await asyncio.to_thread(find)
+        except Exception as e:
+            logger.error(f"Failed to search sticker history: {str(e)}")
+            return None
+    
+    async def get_recent_stickers(self, user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Gets the latest stickers sent to a user
+        
+        Args:
+            user_id (str): User ID
+            limit (int): Maximum number of stickers
+            
+        Returns:
+            List[Dict[str, Any]]: History entries, newest first
+        """
+        if self.sticker_history is None:
+            return []
+        try:
+            return await asyncio.to_thread(self.sticker_history.recent, user_id, limit)
+        except Exception as e:
+            logger.error(f"Failed to read sticker history: {str(e)}")
+            return []
+    
     def cleanup_temp_file(self, file_path: str) -> bool:
         """
         Deletes sticker temp file
@@ -1,23 +1,47 @@
 import json
 import os
+import time
 import logging
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List
 from src.interfaces import StickerStorage
+from src.tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# Key of the last assigned pack IDs in the JSON file, user IDs are numeric so it can't clash
+PACK_IDS_KEY = "_last_pack_ids"
+
 class JSONStickerStorage(StickerStorage):
     """Implementation of sticker pack storage in a JSON file"""
     
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, autosave: bool = True):
         """
         Initializes the sticker pack storage
         
         Args:
             file_path (str): Path to the JSON file for data storage
+            autosave (bool): Whether every change saves the file, False when saving is
+                scheduled by the caller, e.g. by WriteBehindStickerStorage
         """
         self.file_path = file_path
+        self.autosave = autosave
+        # Guards the data against changes while it is serialized in another thread
+        self.lock = threading.Lock()
         self.data = self._load_data()
+        # Last assigned pack ID of every user, kept after packs are removed so an ID is never reused
+        self.last_pack_ids: Dict[str, int] = self.data.pop(PACK_IDS_KEY, {})
+        self._assign_pack_ids()
+    
+    def _assign_pack_ids(self) -> None:
+        """Gives short numeric IDs to packs stored before IDs were introduced and syncs the ID counters"""
+        for user_id, packs in self.data.items():
+            last_id = max([self.last_pack_ids.get(user_id, 0)] + [pack.get("id", 0) for pack in packs.values()])
+            for pack in packs.values():
+                if "id" not in pack:
+                    last_id += 1
+                    pack["id"] = last_id
+            self.last_pack_ids[user_id] = last_id
     
     def _load_data(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -38,6 +62,7 @@ class JSONStickerStorage(StickerStorage):
     def get_user_packs(self, user_id: str) -> Dict[str, Dict[str, Any]]:
         return self.data.get(user_id, {})
     
+    @traced("json_storage.add_sticker_to_pack")
     def add_sticker_to_pack(self, user_id: str, pack_name: str, sticker_info: str) -> None:
         """
         Adds sticker information to a user's pack
@@ -47,18 +72,21 @@ class JSONStickerStorage(StickerStorage):
             pack_name (str): Sticker pack name
             sticker_info (str): Information about the sticker
         """
-        if user_id not in self.data:
-            self.data[user_id] = {}
-        
-        if pack_name not in self.data[user_id]:
-            raise ValueError(f"Sticker pack {pack_name} does not exist for user {user_id}")
-        
-        if "stickers" not in self.data[user_id][pack_name]:
-            self.data[user_id][pack_name]["stickers"] = []
-        
-        self.data[user_id][pack_name]["stickers"].append(sticker_info)
-        self.save()
+        with self.lock:
+            if user_id not in self.data:
+                self.data[user_id] = {}
+            
+            if pack_name not in self.data[user_id]:
+                raise ValueError(f"Sticker pack {pack_name} does not exist for user {user_id}")
+            
+            if "stickers" not in self.data[user_id][pack_name]:
+                self.data[user_id][pack_name]["stickers"] = []
+            
+            self.data[user_id][pack_name]["stickers"].append(sticker_info)
+            self.data[user_id][pack_name]["last_used"] = time.time()
+        self._autosave()
     
+    @traced("json_storage.create_pack")
     def create_pack(self, user_id: str, pack_name: str, display_name: str) -> None:
         """
         Creates a new sticker pack for a user
@@ -68,19 +96,99 @@ class JSONStickerStorage(StickerStorage):
             pack_name (str): System sticker pack name
             display_name (str): Display name for the sticker pack
         """
-        if user_id not in self.data:
-            self.data[user_id] = {}
+        with self.lock:
+            if user_id not in self.data:
+                self.data[user_id] = {}
+            
+            packs = self.data[user_id]
+            pack_id = self.last_pack_ids.get(user_id, 0) + 1
+            self.last_pack_ids[user_id] = pack_id
+            packs[pack_name] = {
+                "id": pack_id,
+                "name": display_name,
+                "stickers": [],
+                "last_used": time.time()
+            }
+        self._autosave()
+    
+    def get_user_ids(self) -> List[str]:
+        """
+        Gets IDs of all users with stored sticker packs
         
-        self.data[user_id][pack_name] = {
-            "name": display_name,
-            "stickers": []
-        }
-        self.save()
+        Returns:
+            List[str]: User IDs
+        """
+        return list(self.data.keys())
     
+    def update_pack_info(self, user_id: str, pack_name: str, info: Dict[str, Any]) -> bool:
+        """
+        Updates stored pack fields, the file is saved only if something changed
+        
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+            info (Dict[str, Any]): Fields to update
+            
+        Returns:
+            bool: True if any field changed
+        """
+        pack = self.data.get(user_id, {}).get(pack_name)
+        if pack is None:
+            return False
+        
+        if any(pack.get(key) != value for key, value in info.items()):
+            with self.lock:
+                pack.update(info)
+            self._autosave()
+            return True
+        return False
+    
+    def remove_pack(self, user_id: str, pack_name: str) -> None:
+        """
+        Removes a sticker pack of a user, users without packs are dropped
+        
+        Args:
+            user_id (str): User ID
+            pack_name (str): Sticker pack name
+        """
+        with self.lock:
+            removed = self.data.get(user_id, {}).pop(pack_name, None)
+            if removed is not None and not self.data[user_id]:
+                del self.data[user_id]
+        if removed is not None:
+            self._autosave()
+    
+    def _autosave(self) -> None:
+        """Saves the file after a change unless saving is scheduled by the caller"""
+        if self.autosave:
+            self.save()
+    
+    @traced("json_storage.save")
     def save(self) -> None:
-        """Saves data to the JSON file"""
-        with open(self.file_path, "w", encoding="utf-8") as f:
-            json.dump(self.data, f, indent=4, ensure_ascii=False)
+        """Saves data to the JSON file, replacing it atomically so a crash never leaves a partial file"""
+        with self.lock:
+            user_ids = list(self.data.keys())
+        
+        # Users are serialized one at a time, so changes made meanwhile wait for the lock only briefly
+        chunks = []
+        for user_id in user_ids:
+            with self.lock:
+                packs = self.data.get(user_id)
+                if packs is None:
+                    continue
+                packs_json = json.dumps(packs, indent=4, ensure_ascii=False)
+            chunks.append(f"    {json.dumps(user_id)}: " + packs_json.replace("\n", "\n    "))
+        with self.lock:
+            if self.last_pack_ids:
+                chunks.append(f"    {json.dumps(PACK_IDS_KEY)}: {json.dumps(self.last_pack_ids)}")
+        payload = "{\n" + ",\n".join(chunks) + "\n}" if chunks else "{}"
+        
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.file_path)
         logger.info(f"Data saved to {self.file_path}")
     
     def has_pack(self, user_id: str, pack_name: str) -> bool:
@@ -2,6 +2,7 @@ import httpx
 import logging
 from typing import Dict, Any, Tuple, Optional
 from src.interfaces import TelegramClient
+from src.tracing import traced, set_span_attributes
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +18,34 @@ class TelegramStickerClient(TelegramClient):
         """
         self.token = token
         self.api_base_url = f"https://api.telegram.org/bot{token}"
+        self.file_base_url = f"https://api.telegram.org/file/bot{token}"
+        self.client = None
     
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Returns the shared HTTP client, keeping connections to Telegram alive between requests
+        
+        Returns:
+            httpx.AsyncClient: HTTP client
+        """
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=30.0)
+        return self.client
+    
+    async def warm_up(self) -> None:
+        """Opens a connection to the Telegram API"""
+        try:
+            await self._get_client().get(f"{self.api_base_url}/getMe")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to warm up Telegram connection: {str(e)}")
+    
+    async def close(self) -> None:
+        """Closes the shared HTTP client"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    @traced("telegram_client.get_sticker_set", attributes=lambda self, sticker_set_name, *args: {"sticker_set": sticker_set_name})
     async def get_sticker_set_info(self, sticker_set_name: str) -> Optional[Dict[str, Any]]:
         """
         Gets information about a sticker set
@@ -30,19 +58,98 @@ class TelegramStickerClient(TelegramClient):
         """
         logger.info(f"Getting sticker set info for: {sticker_set_name}")
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.api_base_url}/getStickerSet",
-                params={"name": sticker_set_name}
-            )
+        response = await self._get_client().get(
+            f"{self.api_base_url}/getStickerSet",
+            params={"name": sticker_set_name}
+        )
+        
+        result = response.json()
+        if not result.get("ok", False):
+            logger.error(f"Failed to get sticker set info: {result.get('description')}")
+            return None
+        
+        return result.get("result")
+    
+    @traced("telegram_client.download_file")
+    async def download_file(self, file_id: str, max_bytes: int) -> Tuple[bool, str, Optional[bytes]]:
+        """
+        Downloads a file sent to the bot, streaming it with a size cap
+        
+        Args:
+            file_id (str): Telegram file ID
+            max_bytes (int): Maximum allowed file size
             
+        Returns:
+            Tuple[bool, str, Optional[bytes]]: (Success, Message, File content)
+        """
+        logger.info(f"Downloading file: {file_id}")
+        too_large = f"Файл слишком большой (максимум {max_bytes // (1024 * 1024)} МБ)"
+        
+        try:
+            client = self._get_client()
+            response = await client.get(f"{self.api_base_url}/getFile", params={"file_id": file_id})
             result = response.json()
             if not result.get("ok", False):
-                logger.error(f"Failed to get sticker set info: {result.get('description')}")
-                return None
+                error_msg = result.get('description', 'Неизвестная ошибка')
+                logger.error(f"Failed to get file: {error_msg}")
+                return False, f"Не удалось получить файл: {error_msg}", None
+            
+            file_info = result["result"]
+            if file_info.get("file_size", 0) > max_bytes:
+                return False, too_large, None
+            
+            # Stream the content so an oversized file is never fully read
+            chunks = []
+            received = 0
+            async with client.stream("GET", f"{self.file_base_url}/{file_info['file_path']}") as stream:
+                stream.raise_for_status()
+                async for chunk in stream.aiter_bytes():
+                    received += len(chunk)
+                    if received > max_bytes:
+                        return False, too_large, None
+                    chunks.append(chunk)
+            
+            set_span_attributes(bytes=received)
+            return True, "Файл загружен", b"".join(chunks)
+        
+        except Exception as e:
+            logger.exception("Error downloading file")
+            return False, f"Произошла ошибка: {str(e)}", None
+    
+    @traced("telegram_client.lookup_sticker_set", attributes=lambda self, sticker_set_name, *args: {"sticker_set": sticker_set_name})
+    async def lookup_sticker_set(self, sticker_set_name: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Gets information about a sticker set and whether it exists
+        
+        Args:
+            sticker_set_name (str): Name of the sticker set
             
-            return result.get("result")
+        Returns:
+            Tuple[Optional[Dict[str, Any]], bool]: (Sticker set info or None, Existence flag).
+                The flag is False only when Telegram reports that the set does not exist,
+                network and other errors return (None, True).
+        """
+        try:
+            response = await self._get_client().get(
+                f"{self.api_base_url}/getStickerSet",
+                params={"name": sticker_set_name}
+            )
+            result = response.json()
+        except Exception as e:
+            logger.error(f"Failed to look up sticker set {sticker_set_name}: {str(e)}")
+            return None, True
+        
+        if result.get("ok", False):
+            return result.get("result"), True
+        
+        description = result.get("description", "")
+        if "STICKERSET_INVALID" in description:
+            return None, False
+        
+        logger.error(f"Failed to look up sticker set {sticker_set_name}: {description}")
+        return None, True
     
+    @traced("telegram_client.add_sticker_to_set", attributes=lambda self, user_id, sticker_set_name, *args: {"sticker_set": sticker_set_name})
     async def add_sticker_to_set(
         self, 
         user_id: str, 
@@ -75,37 +182,38 @@ class TelegramStickerClient(TelegramClient):
             sticker_type = "webm_sticker"
         
         try:
-            async with httpx.AsyncClient() as client:
-                if sticker_type != "png_sticker":
-                    return False, "Тип стикерпака не поддерживается (анимированные или видео стикеры)"
-                
-                # Open sticker file
-                with open(sticker_file_path, "rb") as sticker_file:
-                    files = {sticker_type: ("sticker.webp", sticker_file.read(), "image/webp")}
-                    
-                    # Send request to add sticker
-                    response = await client.post(
-                        f"{self.api_base_url}/addStickerToSet",
-                        data={
-                            "user_id": user_id,
-                            "name": sticker_set_name,
-                            "emojis": "🔥"
-                        },
-                        files=files
-                    )
+            if sticker_type != "png_sticker":
+                return False, "Тип стикерпака не поддерживается (анимированные или видео стикеры)"
+            
+            client = self._get_client()
+            # Open sticker file
+            with open(sticker_file_path, "rb") as sticker_file:
+                files = {sticker_type: ("sticker.webp", sticker_file.read(), "image/webp")}
                 
-                result = response.json()
-                if result.get("ok", False):
-                    return True, "Стикер успешно добавлен"
-                else:
-                    error_msg = result.get('description', 'Неизвестная ошибка')
-                    logger.error(f"Failed to add sticker: {error_msg}")
-                    return False, f"Не удалось добавить стикер: {error_msg}"
+                # Send request to add sticker
+                response = await client.post(
+                    f"{self.api_base_url}/addStickerToSet",
+                    data={
+                        "user_id": user_id,
+                        "name": sticker_set_name,
+                        "emojis": "🔥"
+                    },
+                    files=files
+                )
+            
+            result = response.json()
+            if result.get("ok", False):
+                return True, "Стикер успешно добавлен"
+            else:
+                error_msg = result.get('description', 'Неизвестная ошибка')
+                logger.error(f"Failed to add sticker: {error_msg}")
+                return False, f"Не удалось добавить стикер: {error_msg}"
         
         except Exception as e:
             logger.exception("Error adding sticker to set")
             return False, f"Произошла ошибка: {str(e)}"
     
+    @traced("telegram_client.create_sticker_set", attributes=lambda self, user_id, sticker_set_name, *args: {"sticker_set": sticker_set_name})
     async def create_sticker_set(
         self, 
         user_id: str, 
@@ -128,30 +236,30 @@ class TelegramStickerClient(TelegramClient):
         logger.info(f"Creating new sticker set: {sticker_set_name} with title: {title}")
         
         try:
-            async with httpx.AsyncClient() as client:
-                # Open sticker file
-                with open(sticker_file_path, "rb") as sticker_file:
-                    files = {"png_sticker": ("sticker.webp", sticker_file.read(), "image/webp")}
-                    
-                    # Send request to create sticker pack
-                    response = await client.post(
-                        f"{self.api_base_url}/createNewStickerSet",
-                        data={
-                            "user_id": user_id,
-                            "name": sticker_set_name,
-                            "title": title,
-                            "emojis": "🔥"
-                        },
-                        files=files
-                    )
+            client = self._get_client()
+            # Open sticker file
+            with open(sticker_file_path, "rb") as sticker_file:
+                files = {"png_sticker": ("sticker.webp", sticker_file.read(), "image/webp")}
                 
-                result = response.json()
-                if result.get("ok", False):
-                    return True, "Стикерпак успешно создан"
-                else:
-                    error_msg = result.get('description', 'Неизвестная ошибка')
-                    logger.error(f"Failed to create sticker set: {error_msg}")
-                    return False, f"Не удалось создать стикерпак: {error_msg}"
+                # Send request to create sticker pack
+                response = await client.post(
+                    f"{self.api_base_url}/createNewStickerSet",
+                    data={
+                        "user_id": user_id,
+                        "name": sticker_set_name,
+                        "title": title,
+                        "emojis": "🔥"
+                    },
+                    files=files
+                )
+            
+            result = response.json()
+            if result.get("ok", False):
+                return True, "Стикерпак успешно создан"
+            else:
+                error_msg = result.get('description', 'Неизвестная ошибка')
+                logger.error(f"Failed to create sticker set: {error_msg}")
+                return False, f"Не удалось создать стикерпак: {error_msg}"
         
         except Exception as e:
             logger.exception("Error creating sticker set")
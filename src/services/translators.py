@@ -0,0 +1,207 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from src.interfaces import Translator
+
+logger = logging.getLogger(__name__)
+
+class GoogleTranslateTranslator(Translator):
+    """Translator using Google Translate over the network"""
+
+    def __init__(self, source: str = "ru", target: str = "en"):
+        """
+        Initializes the translator, the client is created on first use
+
+        Args:
+            source (str): Source language code
+            target (str): Target language code
+        """
+        self.source = source
+        self.target = target
+        self.client = None
+
+    def _get_client(self):
+        """Creates the Google Translate client on first use"""
+        if self.client is None:
+            from deep_translator import GoogleTranslator
+            self.client = GoogleTranslator(source=self.source, target=self.target)
+        return self.client
+
+    def warm_up(self) -> None:
+        """Imports the client library"""
+        self._get_client()
+
+    def translate(self, text: str) -> str:
+        """
+        Translates text with Google Translate
+
+        Args:
+            text (str): Source text
+
+        Returns:
+            str: Translated text
+        """
+        return self._get_client().translate(text)
+
+class MarianTranslator(Translator):
+    """
+    Offline translator running a MarianMT model on CPU
+
+    The model is loaded once and all translations run in one dedicated thread,
+    so concurrent requests don't compete for CPU threads of the model.
+    Requires the optional transformers, sentencepiece and torch packages.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "Helsinki-NLP/opus-mt-ru-en",
+        num_threads: Optional[int] = 2,
+        max_new_tokens: int = 64
+    ):
+        """
+        Initializes the translator, the model is loaded on first use
+
+        Args:
+            model_name (str): Hugging Face model identifier, a local path works without network
+            num_threads (Optional[int]): Number of CPU threads used by the model, None for the default
+            max_new_tokens (int): Maximum length of the translation in tokens
+        """
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self.max_new_tokens = max_new_tokens
+        self.model = None
+        self.tokenizer = None
+        self.load_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translator")
+
+    def _load(self) -> None:
+        """Loads the tokenizer and the model on first use"""
+        with self.load_lock:
+            if self.model is not None:
+                return
+            import torch
+            from transformers import MarianMTModel, MarianTokenizer
+
+            if self.num_threads:
+                torch.set_num_threads(self.num_threads)
+            logger.info(f"Loading translation model: {self.model_name}")
+            self.tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+            model = MarianMTModel.from_pretrained(self.model_name)
+            model.eval()
+            self.model = model
+
+    def warm_up(self) -> None:
+        """Loads the model and runs one translation to initialize its kernels"""
+        self.translate("привет")
+
+    def _translate(self, text: str) -> str:
+        """Translates text in the translator thread"""
+        import torch
+
+        self._load()
+        inputs = self.tokenizer([text], return_tensors="pt", truncation=True)
+        with torch.inference_mode():
+            # Greedy decoding is several times faster than beam search and good enough for short prompts
+            output = self.model.generate(**inputs, num_beams=1, max_new_tokens=self.max_new_tokens)
+        return self.tokenizer.decode(output[0], skip_special_tokens=True)
+
+    def translate(self, text: str) -> str:
+        """
+        Translates text with the local model
+
+        Args:
+            text (str): Source text
+
+        Returns:
+            str: Translated text
+        """
+        return self.executor.submit(self._translate, text).result()
+
+class PassthroughTranslator(Translator):
+    """Returns text unchanged, for image models that understand Russian prompts"""
+
+    def translate(self, text: str) -> str:
+        return text
+
+class FallbackTranslator(Translator):
+    """Uses the first translator that works, e.g. an offline model with Google Translate as backup"""
+
+    def __init__(self, translators: List[Translator]):
+        """
+        Initializes the translator
+
+        Args:
+            translators (List[Translator]): Translators in order of preference
+        """
+        if not translators:
+            raise ValueError("At least one translator is required")
+        self.translators = translators
+
+    def warm_up(self) -> None:
+        """Warms up the preferred translator"""
+        self.translators[0].warm_up()
+
+    def translate(self, text: str) -> str:
+        """
+        Translates text with the first translator that succeeds
+
+        Args:
+            text (str): Source text
+
+        Returns:
+            str: Translated text
+
+        Raises:
+            Exception: Error of the last translator if all of them failed
+        """
+        for translator in self.translators[:-1]:
+            try:
+                return translator.translate(text)
+            except Exception as e:
+                logger.error(f"{type(translator).__name__} failed, trying the next translator: {str(e)}")
+        return self.translators[-1].translate(text)
+
+class CachedTranslator(Translator):
+    """LRU cache in front of another translator, repeated and regenerated prompts are translated once"""
+
+    def __init__(self, translator: Translator, max_size: int = 1024):
+        """
+        Initializes the cache
+
+        Args:
+            translator (Translator): Translator whose results are cached
+            max_size (int): Number of cached translations
+        """
+        self.translator = translator
+        self.max_size = max_size
+        self.cache: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        """Warms up the wrapped translator"""
+        self.translator.warm_up()
+
+    def translate(self, text: str) -> str:
+        """
+        Translates text, using the cached result if available
+
+        Args:
+            text (str): Source text
+
+        Returns:
+            str: Translated text
+        """
+        key = " ".join(text.split())
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        translation = self.translator.translate(key)
+        with self.lock:
+            self.cache[key] = translation
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return translation
@@ -0,0 +1,127 @@
+import json
+import asyncio
+import logging
+import threading
+from typing import Any, Optional
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+class RedisUpdateRouter:
+    """
+    Routes updates of a chat to the one bot instance owning it
+
+    Telegram delivers webhook updates to whichever instance the load balancer picks,
+    but the application keeps conversation states and user data in memory, so every
+    update of a chat has to be handled by the same instance. The owner of a chat is
+    its ID modulo the number of instances. Updates received by another instance are
+    pushed to the owner's Redis list and picked up by its listener thread; updates
+    for a stopped instance wait in its list until it is back.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        instance_index: int,
+        instance_count: int,
+        prefix: str = "stickers:updates:",
+        poll_timeout: int = 1,
+        reconnect_delay: float = 1.0
+    ):
+        """
+        Initializes the router
+
+        Args:
+            client (Any): redis.Redis compatible client created with decode_responses=True
+            instance_index (int): Index of this instance from 0 to instance_count - 1
+            instance_count (int): Number of bot instances behind the webhook
+            prefix (str): Prefix of the update list keys
+            poll_timeout (int): Time in seconds a BLPOP call waits, bounds the time to stop the listener
+            reconnect_delay (float): Pause in seconds before polling again after a connection error
+        """
+        if not 0 <= instance_index < instance_count:
+            raise ValueError(f"Instance index {instance_index} is out of range for {instance_count} instances")
+        self.client = client
+        self.instance_index = instance_index
+        self.instance_count = instance_count
+        self.prefix = prefix
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def _queue_key(self, instance_index: int) -> str:
+        """Returns the key of the list with updates forwarded to an instance"""
+        return f"{self.prefix}{instance_index}"
+
+    def owner(self, update: Update) -> int:
+        """
+        Gets the index of the instance handling an update
+
+        Args:
+            update (Update): Incoming update
+
+        Returns:
+            int: Instance index, this instance for updates without a chat or user
+        """
+        if update.effective_chat is not None:
+            return update.effective_chat.id % self.instance_count
+        if update.effective_user is not None:
+            return update.effective_user.id % self.instance_count
+        return self.instance_index
+
+    async def route(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """
+        Forwards updates of chats owned by other instances and stops their handling here.
+        Registered as a TypeHandler in a group running before all other handlers
+
+        Args:
+            update (object): Incoming update
+            context (ContextTypes.DEFAULT_TYPE): Callback context
+        """
+        if not isinstance(update, Update):
+            return
+        owner = self.owner(update)
+        if owner == self.instance_index:
+            return
+        await asyncio.to_thread(self.client.rpush, self._queue_key(owner), json.dumps(update.to_dict()))
+        raise ApplicationHandlerStop
+
+    def start(self, application: Application) -> None:
+        """
+        Starts taking updates forwarded to this instance in a background thread,
+        must be called from the event loop
+
+        Args:
+            application (Application): Application whose update queue receives the updates
+        """
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(
+            target=self._listen, args=(application, asyncio.get_running_loop()), name="update-router", daemon=True
+        )
+        self.thread.start()
+        logger.info(f"Update router started as instance {self.instance_index} of {self.instance_count}")
+
+    def stop(self) -> None:
+        """Stops the listener thread, updates still in the list are taken after the next start"""
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join(timeout=self.poll_timeout + 5.0)
+            self.thread = None
+
+    def _listen(self, application: Application, loop: asyncio.AbstractEventLoop) -> None:
+        """Moves forwarded updates to the application until stopped"""
+        key = self._queue_key(self.instance_index)
+        while not self.stop_event.is_set():
+            try:
+                item = self.client.blpop([key], timeout=self.poll_timeout)
+                if item is None:
+                    continue
+                update = Update.de_json(json.loads(item[1]), application.bot)
+                asyncio.run_coroutine_threadsafe(application.update_queue.put(update), loop).result()
+            except Exception as e:
+                logger.error(f"Update router listener failed, retrying: {str(e)}")
+                self.stop_event.wait(self.reconnect_delay)
@@ -0,0 +1,322 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.tracing import set_span_attributes
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a worker process exits while running a job"""
+
+def _reset_peak_memory() -> None:
+    """Resets the peak RSS of the current process, so it can be measured per job (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _read_memory() -> Tuple[Optional[int], Optional[int]]:
+    """
+    Reads memory usage of the current process
+
+    Returns:
+        Tuple[Optional[int], Optional[int]]: (Current RSS, Peak RSS) in bytes, None if unknown
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        import resource
+        # ru_maxrss is the lifetime peak and is reported in kilobytes on Linux
+        return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _worker_main(
+    conn,
+    factory: Callable[[], Any],
+    initializer: Optional[Callable[..., None]],
+    initargs: Tuple,
+    memory_limit: Optional[int]
+) -> None:
+    """
+    Entry point of a worker process, runs jobs received through the pipe until told to stop
+
+    Args:
+        conn: Pipe connection to the pool
+        factory (Callable[[], Any]): Creates the object whose methods are run as jobs
+        initializer (Optional[Callable[..., None]]): Called once before the object is created
+        initargs (Tuple): Arguments of the initializer
+        memory_limit (Optional[int]): Address space limit in bytes
+    """
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - [worker %(process)d] %(message)s', level=logging.INFO
+    )
+    if memory_limit:
+        import resource
+        # Allocations above the limit fail with MemoryError instead of growing the process
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    if initializer is not None:
+        initializer(*initargs)
+
+    target = factory()
+    try:
+        target.warm_up()
+    except Exception:
+        logger.exception("Worker warm-up failed, dependencies will be loaded on first job")
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        method, args = job
+        _reset_peak_memory()
+        started = time.perf_counter()
+        try:
+            ok, result = True, getattr(target, method)(*args)
+        except Exception as e:
+            ok, result = False, e
+        rss, peak = _read_memory()
+        stats = {"duration": time.perf_counter() - started, "rss": rss, "peak": peak}
+
+        try:
+            conn.send((ok, result, stats))
+        except Exception as e:
+            # The result or the exception could not be pickled
+            error = e if ok else result
+            conn.send((False, RuntimeError(f"{type(error).__name__}: {str(error)}"), stats))
+
+class _Worker:
+    """Pool-side handle of a worker process"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+
+class RecyclingProcessPool:
+    """
+    Pool of worker processes that are replaced before their memory grows
+
+    A worker is recycled after a number of jobs, when its RSS exceeds a limit
+    after a job, or after a MemoryError. Workers are started with the spawn
+    method, so they don't inherit threads or memory of the bot process.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        workers: int = 2,
+        max_jobs_per_worker: Optional[int] = 500,
+        max_rss_mb: Optional[float] = None,
+        memory_limit_mb: Optional[float] = None,
+        job_timeout: Optional[float] = 120.0,
+        acquire_timeout: Optional[float] = 300.0,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple = ()
+    ):
+        """
+        Initializes the pool, worker processes start on first use
+
+        Args:
+            factory (Callable[[], Any]): Picklable callable creating the object whose methods are run as jobs
+            workers (int): Number of worker processes
+            max_jobs_per_worker (Optional[int]): Jobs after which a worker is replaced, None for unlimited
+            max_rss_mb (Optional[float]): RSS in MB after a job above which a worker is replaced
+            memory_limit_mb (Optional[float]): Hard address space limit of a worker in MB (RLIMIT_AS).
+                ONNX Runtime reserves much more address space than it uses, so keep a generous margin
+            job_timeout (Optional[float]): Time in seconds after which a job is aborted and its worker killed
+            acquire_timeout (Optional[float]): Longest time in seconds a job waits for a free worker
+            initializer (Optional[Callable[..., None]]): Picklable callable run in each worker at start
+            initargs (Tuple): Arguments of the initializer
+        """
+        self.factory = factory
+        self.workers = workers
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_rss = int(max_rss_mb * MB) if max_rss_mb else None
+        self.memory_limit = int(memory_limit_mb * MB) if memory_limit_mb else None
+        self.job_timeout = job_timeout
+        self.acquire_timeout = acquire_timeout
+        self.initializer = initializer
+        self.initargs = initargs
+        self.context = multiprocessing.get_context("spawn")
+        self.idle: "queue.Queue[_Worker]" = queue.Queue()
+        self.all_workers = set()
+        self.lock = threading.Lock()
+        self.started = False
+        self.closed = False
+        self.recycled = 0
+
+    def start(self) -> None:
+        """
+        Starts the worker processes
+
+        Raises:
+            RuntimeError: If the pool was closed
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Worker pool is closed")
+            if self.started:
+                return
+            self.started = True
+            for _ in range(self.workers):
+                self.idle.put(self._spawn())
+        logger.info(f"Started {self.workers} worker processes")
+
+    def _spawn(self) -> _Worker:
+        """Starts a new worker process"""
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.factory, self.initializer, self.initargs, self.memory_limit),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self.all_workers.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker, kill: bool = False) -> None:
+        """Stops a worker process"""
+        self.all_workers.discard(worker)
+        try:
+            if not kill:
+                worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        worker.process.join(timeout=0 if kill else 5.0)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        worker.conn.close()
+
+    def _replace(self, worker: _Worker, reason: str, kill: bool = False) -> None:
+        """Retires a worker and puts a fresh one into the pool unless the pool was closed meanwhile"""
+        logger.info(f"Recycling worker {worker.process.pid} after {worker.jobs} jobs: {reason}")
+        self.recycled += 1
+        self._retire(worker, kill)
+        with self.lock:
+            if not self.closed:
+                self.idle.put(self._spawn())
+
+    def _release(self, worker: _Worker) -> None:
+        """Returns a worker to the pool, or stops it if the pool was closed during its job"""
+        with self.lock:
+            if not self.closed:
+                self.idle.put(worker)
+                return
+        self._retire(worker)
+
+    def _acquire(self) -> _Worker:
+        """
+        Waits for a free worker
+
+        Returns:
+            _Worker: Worker taken from the pool
+
+        Raises:
+            TimeoutError: If no worker became free within acquire_timeout
+            RuntimeError: If the pool was closed while waiting
+        """
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        while True:
+            if self.closed:
+                raise RuntimeError("Worker pool is closed")
+            # Short waits, so waiting jobs notice when the pool is closed
+            wait = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+            if wait <= 0:
+                raise TimeoutError(f"No free worker process within {self.acquire_timeout}s")
+            try:
+                return self.idle.get(timeout=wait)
+            except queue.Empty:
+                continue
+
+    def run(self, method: str, *args: Any) -> Any:
+        """
+        Runs a method of the worker object in a free worker process, blocking until done
+
+        Args:
+            method (str): Method name
+            *args: Picklable method arguments
+
+        Returns:
+            Any: Method result
+
+        Raises:
+            TimeoutError: If no worker became free or the job exceeded job_timeout
+            WorkerCrashedError: If the worker process died during the job
+            RuntimeError: If the pool was closed
+            Exception: Exception raised by the method
+        """
+        self.start()
+        worker = self._acquire()
+        try:
+            worker.conn.send((method, args))
+            finished = worker.conn.poll(self.job_timeout)
+            if finished:
+                ok, result, stats = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            exitcode = worker.process.exitcode
+            self._replace(worker, f"process died with exit code {exitcode}", kill=True)
+            raise WorkerCrashedError(f"Worker process died during {method} (exit code {exitcode})") from e
+        except BaseException:
+            # Interrupted midway, e.g. arguments that can't be pickled, the pipe may be out of sync
+            self._replace(worker, "job interrupted", kill=True)
+            raise
+
+        if not finished:
+            self._replace(worker, "job timed out", kill=True)
+            raise TimeoutError(f"Worker job {method} timed out after {self.job_timeout}s")
+
+        worker.jobs += 1
+        self._record(worker, method, stats)
+
+        if not ok and isinstance(result, MemoryError):
+            self._replace(worker, "memory limit reached")
+        elif self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+            self._replace(worker, "job limit reached")
+        elif self.max_rss and stats["rss"] and stats["rss"] > self.max_rss:
+            self._replace(worker, f"RSS {stats['rss'] / MB:.0f} MB above limit")
+        else:
+            self._release(worker)
+
+        if not ok:
+            raise result
+        return result
+
+    def _record(self, worker: _Worker, method: str, stats: Dict[str, Any]) -> None:
+        """Logs memory usage of a finished job"""
+        peak = stats["peak"] or 0
+        rss = f"{stats['rss'] / MB:.0f} MB" if stats["rss"] else "unknown"
+        logger.info(
+            f"Worker {worker.process.pid} ran {method} in {stats['duration']:.2f}s, "
+            f"peak RSS {peak / MB:.0f} MB, RSS after job {rss}"
+        )
+        set_span_attributes(worker_pid=worker.process.pid, peak_rss_mb=round(peak / MB, 1))
+
+    def close(self) -> None:
+        """
+        Stops the idle worker processes, the pool can't be used afterwards.
+        Running jobs are not interrupted, their workers stop when the job is done
+        """
+        with self.lock:
+            self.closed = True
+            idle = []
+            while True:
+                try:
+                    idle.append(self.idle.get_nowait())
+                except queue.Empty:
+                    break
+        for worker in idle:
+            self._retire(worker)
@@ -0,0 +1,210 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from src.interfaces import StickerStorage
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindStickerStorage(StickerStorage):
+    """
+    Write-behind layer keeping storage writes off the event loop
+
+    Changes are applied to the in-memory data of the wrapped storage at once and
+    saved by a background task in a worker thread. Saving waits until changes stop
+    for flush_interval seconds, but not longer than max_staleness after the first
+    unsaved change, and starts at once when max_batch_size changes are pending.
+    The wrapped storage must not save by itself, e.g. JSONStickerStorage(autosave=False).
+    """
+
+    def __init__(
+        self,
+        storage: StickerStorage,
+        flush_interval: float = 1.0,
+        max_staleness: float = 5.0,
+        max_batch_size: int = 100
+    ):
+        """
+        Initializes the write-behind layer
+
+        Args:
+            storage (StickerStorage): Wrapped storage
+            flush_interval (float): Quiet time in seconds after the last change before saving
+            max_staleness (float): Longest time in seconds a change may stay unsaved
+            max_batch_size (int): Number of pending changes that triggers an immediate save
+        """
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_staleness = max_staleness
+        self.max_batch_size = max_batch_size
+
+        # Changes may be registered from worker threads, the counters are guarded by the lock
+        self.state_lock = threading.Lock()
+        self.pending = 0
+        self.first_change: Optional[float] = None
+        self.last_change = 0.0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.changed: Optional[asyncio.Event] = None
+        self.flush_lock: Optional[asyncio.Lock] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # Flush metrics
+        self.flushes = 0
+        self.flushed_changes = 0
+        self.failed_flushes = 0
+        self.total_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def start(self) -> None:
+        """Starts the background flush task, must be called from the event loop"""
+        if self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task = asyncio.create_task(self._run())
+        if self.pending:
+            self.changed.set()
+
+    async def stop(self) -> None:
+        """Stops the background task and saves all pending changes, called on shutdown"""
+        if self.task is not None:
+            # Holding the lock makes sure a running save is not interrupted
+            async with self.flush_lock:
+                self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+        logger.info(f"Sticker storage write-behind stopped: {self.stats()}")
+
+    def _mark_changed(self) -> None:
+        """Registers a change that has to be saved"""
+        now = time.monotonic()
+        with self.state_lock:
+            self.pending += 1
+            self.last_change = now
+            if self.first_change is None:
+                self.first_change = now
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.changed.set)
+
+    async def _run(self) -> None:
+        """Saves changes after they settle, forever"""
+        while True:
+            await self.changed.wait()
+            await self._wait_for_batch()
+            if not await self.flush():
+                # Keep the changes and retry later instead of hammering a failing disk
+                await asyncio.sleep(self.flush_interval)
+
+    async def _wait_for_batch(self) -> None:
+        """Waits until changes stop coming, the batch is full or the oldest change becomes too stale"""
+        while self.pending:
+            now = time.monotonic()
+            deadline = min(self.last_change + self.flush_interval, self.first_change + self.max_staleness)
+            if self.pending >= self.max_batch_size or now >= deadline:
+                return
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), deadline - now)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self) -> bool:
+        """
+        Saves all pending changes in a worker thread
+
+        Returns:
+            bool: False if saving failed, the changes stay pending
+        """
+        if self.flush_lock is None:
+            # Not started, e.g. shutdown before initialization completed
+            if self.pending:
+                with self.state_lock:
+                    self.pending = 0
+                    self.first_change = None
+                await asyncio.to_thread(self.storage.save)
+            return True
+
+        async with self.flush_lock:
+            if self.changed is not None:
+                self.changed.clear()
+            if not self.pending:
+                return True
+
+            with self.state_lock:
+                changes, first_change = self.pending, self.first_change
+                self.pending = 0
+                self.first_change = None
+
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.storage.save)
+            except Exception:
+                logger.exception("Error saving sticker storage")
+                self.failed_flushes += 1
+                with self.state_lock:
+                    self.pending += changes
+                    self.first_change = first_change if self.first_change is None else min(first_change, self.first_change)
+                return False
+
+            latency = time.perf_counter() - started
+            self.flushes += 1
+            self.flushed_changes += changes
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            logger.debug(
+                f"Saved {changes} sticker storage changes in {latency * 1000:.1f} ms, "
+                f"oldest change waited {time.monotonic() - first_change:.2f}s"
+            )
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns flush metrics
+
+        Returns:
+            Dict[str, Any]: Number of flushes and saved changes, average and maximum flush latency in ms
+        """
+        return {
+            "flushes": self.flushes,
+            "changes": self.flushed_changes,
+            "failed_flushes": self.failed_flushes,
+            "pending": self.pending,
+            "avg_latency_ms": round(self.total_flush_latency / self.flushes * 1000, 1) if self.flushes else 0.0,
+            "max_latency_ms": round(self.max_flush_latency * 1000, 1)
+        }
+
+    def get_user_packs(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.storage.get_user_packs(user_id)
+
+    def add_sticker_to_pack(self, user_id: str, pack_name: str, sticker_info: str) -> None:
+        self.storage.add_sticker_to_pack(user_id, pack_name, sticker_info)
+        self._mark_changed()
+
+    def create_pack(self, user_id: str, pack_name: str, display_name: str) -> None:
+        self.storage.create_pack(user_id, pack_name, display_name)
+        self._mark_changed()
+
+    def get_user_ids(self) -> List[str]:
+        return self.storage.get_user_ids()
+
+    def update_pack_info(self, user_id: str, pack_name: str, info: Dict[str, Any]) -> bool:
+        # Reconciliation reports mostly unchanged packs, they must not cause saves
+        if self.storage.update_pack_info(user_id, pack_name, info):
+            self._mark_changed()
+            return True
+        return False
+
+    def remove_pack(self, user_id: str, pack_name: str) -> None:
+        if pack_name in self.storage.get_user_packs(user_id):
+            self.storage.remove_pack(user_id, pack_name)
+            self._mark_changed()
+
+    def save(self) -> None:
+        """Schedules saving instead of writing on the caller's thread"""
+        self._mark_changed()
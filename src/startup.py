@@ -0,0 +1,102 @@
+import sys
+import time
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ImportProfiler:
+    """Measures time spent importing each module during startup"""
+
+    def __init__(self):
+        """Initializes the profiler, measurement starts with start()"""
+        self.self_times: Dict[str, float] = {}
+        self.total_times: Dict[str, float] = {}
+        self._local = threading.local()
+        self._bootstrap = sys.modules["_frozen_importlib"]
+        self._original_find_and_load = None
+        self.started_at = None
+
+    def start(self) -> None:
+        """Starts recording module imports"""
+        if self._original_find_and_load is not None:
+            return
+
+        self.started_at = time.perf_counter()
+        self._original_find_and_load = self._bootstrap._find_and_load
+        original = self._original_find_and_load
+        local = self._local
+
+        def find_and_load(name, import_):
+            # Called by the import system only for modules not yet in sys.modules
+            stack = getattr(local, "stack", None)
+            if stack is None:
+                stack = local.stack = []
+
+            stack.append(0.0)
+            started = time.perf_counter()
+            try:
+                return original(name, import_)
+            finally:
+                elapsed = time.perf_counter() - started
+                children = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.self_times[name] = self.self_times.get(name, 0.0) + elapsed - children
+                self.total_times[name] = self.total_times.get(name, 0.0) + elapsed
+
+        self._bootstrap._find_and_load = find_and_load
+
+    def stop(self) -> None:
+        """Stops recording module imports"""
+        if self._original_find_and_load is not None:
+            self._bootstrap._find_and_load = self._original_find_and_load
+            self._original_find_and_load = None
+
+    def package_times(self) -> List[Tuple[str, float]]:
+        """
+        Sums import self time by top-level package
+
+        Returns:
+            List[Tuple[str, float]]: (Package name, Seconds) sorted by time, slowest first
+        """
+        packages: Dict[str, float] = {}
+        for name, elapsed in self.self_times.items():
+            package = name.partition(".")[0]
+            packages[package] = packages.get(package, 0.0) + elapsed
+        return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+    def report(self, limit: int = 20) -> str:
+        """
+        Builds a human readable import time report
+
+        Args:
+            limit (int): Number of packages and modules to include
+
+        Returns:
+            str: Report text
+        """
+        lines = [f"Import time by package (top {limit}):"]
+        for package, elapsed in self.package_times()[:limit]:
+            lines.append(f"  {elapsed * 1000:9.1f} ms  {package}")
+
+        lines.append(f"Slowest modules by cumulative time (top {limit}):")
+        slowest = sorted(self.total_times.items(), key=lambda item: item[1], reverse=True)
+        for name, elapsed in slowest[:limit]:
+            lines.append(
+                f"  {elapsed * 1000:9.1f} ms  (self {self.self_times[name] * 1000:7.1f} ms)  {name}"
+            )
+
+        lines.append(f"Total modules imported: {len(self.total_times)}")
+        return "\n".join(lines)
+
+    def log_report(self, stage: str) -> None:
+        """
+        Logs the import time report
+
+        Args:
+            stage (str): Name of the startup stage the report is taken at
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        logger.info(f"Startup profile at '{stage}' ({elapsed:.2f}s since start):\n{self.report()}")
@@ -0,0 +1,413 @@
+import json
+import time
+import queue
+import random
+import inspect
+import logging
+import functools
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """Spans recorded while handling one Telegram update"""
+
+    __slots__ = ("trace_id", "spans", "error")
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List["Span"] = []
+        self.error = False
+
+class Span:
+    """Timed step of a trace with attributes"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start_time", "started", "duration", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        """
+        Starts the span
+
+        Args:
+            trace (Trace): Trace the span belongs to
+            name (str): Step name
+            parent_id (Optional[str]): ID of the enclosing span, None for the root span
+            attributes (Dict[str, Any]): Step attributes
+        """
+        self.trace = trace
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time_ns()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Sets an attribute of the span"""
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Converts the finished span to a serializable dictionary
+
+        Returns:
+            Dict[str, Any]: Span data
+        """
+        duration_ns = int((self.duration or 0.0) * 1e9)
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time_ns": self.start_time,
+            "end_time_ns": self.start_time + duration_ns,
+            "duration_ms": round(duration_ns / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class SpanExporter(ABC):
+    """Destination of finished spans"""
+
+    @abstractmethod
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        """Sends a batch of spans"""
+        pass
+
+    def shutdown(self) -> None:
+        """Releases resources of the exporter"""
+        pass
+
+class JSONLSpanExporter(SpanExporter):
+    """Appends spans to a local file, one JSON object per line"""
+
+    def __init__(self, file_path: str):
+        """
+        Initializes the exporter
+
+        Args:
+            file_path (str): Path to the JSONL file
+        """
+        self.file_path = file_path
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str))
+                f.write("\n")
+
+class OTLPSpanExporter(SpanExporter):
+    """Sends spans to an OpenTelemetry collector with the OTLP/HTTP JSON protocol"""
+
+    def __init__(self, endpoint: str, service_name: str = "sticker-bot", timeout: float = 5.0):
+        """
+        Initializes the exporter
+
+        Args:
+            endpoint (str): Collector traces URL, e.g. http://localhost:4318/v1/traces
+            service_name (str): Service name reported to the collector
+            timeout (float): Request timeout in seconds
+        """
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.http_session = None
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        """Converts an attribute to the OTLP key-value format"""
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _convert(self, span: Dict[str, Any]) -> Dict[str, Any]:
+        """Converts a span to the OTLP span format"""
+        converted = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(span["start_time_ns"]),
+            "endTimeUnixNano": str(span["end_time_ns"]),
+            "attributes": [self._attribute(key, value) for key, value in span["attributes"].items()],
+            "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1}
+        }
+        if span["parent_id"]:
+            converted["parentSpanId"] = span["parent_id"]
+        return converted
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        if self.http_session is None:
+            import requests
+            self.http_session = requests.Session()
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": __name__},
+                    "spans": [self._convert(span) for span in spans]
+                }]
+            }]
+        }
+        response = self.http_session.post(self.endpoint, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        if self.http_session is not None:
+            self.http_session.close()
+
+class BatchSpanProcessor:
+    """Serializes and exports finished traces in a background thread"""
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 10000,
+        max_batch_size: int = 512,
+        flush_interval: float = 2.0
+    ):
+        """
+        Initializes the processor
+
+        Args:
+            exporter (SpanExporter): Destination of spans
+            max_queue_size (int): Number of queued spans after which new ones are dropped
+            max_batch_size (int): Maximum number of spans sent in one export
+            flush_interval (float): Longest time in seconds a span waits in the queue
+        """
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._serve, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        """
+        Queues spans of a finished trace without blocking
+
+        Args:
+            spans (List[Span]): Finished spans
+        """
+        for span in spans:
+            try:
+                self.queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _export(self, batch: List[Span]) -> None:
+        """Exports a batch, export errors are logged and the batch is dropped"""
+        try:
+            self.exporter.export([span.to_dict() for span in batch])
+        except Exception as e:
+            logger.error(f"Failed to export {len(batch)} spans: {str(e)}")
+
+    def _serve(self) -> None:
+        """Collects spans into batches until shut down"""
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self.queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                span = False
+
+            if span is None:
+                if batch:
+                    self._export(batch)
+                return
+            if span:
+                batch.append(span)
+
+            if len(batch) >= self.max_batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._export(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def shutdown(self) -> None:
+        """Exports the queued spans and stops the background thread"""
+        self.queue.put(None)
+        self.thread.join(timeout=10.0)
+        self.exporter.shutdown()
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} spans because the export queue was full")
+
+class Tracer:
+    """
+    Records nested spans of Telegram updates
+
+    Spans are cheap to record, the cost is in exporting them, so sampling happens
+    when a trace is finished: a sample_rate share of traces is exported, while
+    failed traces and traces slower than slow_threshold are always kept.
+    """
+
+    def __init__(self):
+        self.processor: Optional[BatchSpanProcessor] = None
+        self.sample_rate = 1.0
+        self.slow_threshold = 10.0
+
+    def configure(
+        self,
+        processor: Optional[BatchSpanProcessor],
+        sample_rate: float = 1.0,
+        slow_threshold: float = 10.0
+    ) -> None:
+        """
+        Enables or disables tracing
+
+        Args:
+            processor (Optional[BatchSpanProcessor]): Span processor, None disables tracing
+            sample_rate (float): Share of ordinary traces that are exported
+            slow_threshold (float): Duration in seconds after which a trace is always exported
+        """
+        self.processor = processor
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    def is_recording(self, root: bool = False) -> bool:
+        """
+        Checks if a span started now would be recorded
+
+        Args:
+            root (bool): Whether the span may start a new trace
+
+        Returns:
+            bool: True if the span would be recorded
+        """
+        return self.processor is not None and (root or _current_span.get() is not None)
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Records a span around the block
+
+        Outside of a trace nothing is recorded unless root is set.
+
+        Args:
+            name (str): Step name
+            root (bool): Whether to start a new trace if there is no current one
+            **attributes: Step attributes
+
+        Yields:
+            Optional[Span]: Recorded span or None
+        """
+        parent = _current_span.get()
+        if self.processor is None or (parent is None and not root):
+            yield None
+            return
+
+        trace = Trace() if parent is None else parent.trace
+        span = Span(trace, name, None if parent is None else parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            trace.error = True
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span.started
+            trace.spans.append(span)
+            if parent is None:
+                self._finish(trace, span)
+
+    def _finish(self, trace: Trace, root: Span) -> None:
+        """Exports a finished trace if it is sampled"""
+        processor = self.processor
+        if processor is None:
+            return
+        if trace.error or root.duration >= self.slow_threshold or random.random() < self.sample_rate:
+            # Spans of hedged requests may still finish later, they are not exported
+            processor.submit(list(trace.spans))
+
+tracer = Tracer()
+
+def current_trace_id() -> Optional[str]:
+    """
+    Gets the ID of the trace being recorded
+
+    Returns:
+        Optional[str]: Trace ID or None outside of a trace
+    """
+    span = _current_span.get()
+    return None if span is None else span.trace.trace_id
+
+def set_span_attributes(**attributes: Any) -> None:
+    """Sets attributes of the current span, does nothing outside of a trace"""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+def record_span_error(error: str) -> None:
+    """
+    Marks the current span as failed for errors that are handled instead of raised,
+    failed traces are always exported
+
+    Args:
+        error (str): Error description
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.error = error
+        span.trace.error = True
+
+def traced(
+    name: Optional[str] = None,
+    root: bool = False,
+    attributes: Optional[Callable[..., Dict[str, Any]]] = None
+):
+    """
+    Records a span around every call of a function or coroutine function
+
+    Args:
+        name (Optional[str]): Span name, the qualified function name by default
+        root (bool): Whether a call outside of a trace starts a new trace
+        attributes (Optional[Callable[..., Dict[str, Any]]]): Builds span attributes
+            from the call arguments, called only when the span is recorded
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.is_recording(root):
+                    return await func(*args, **kwargs)
+                span_attributes = attributes(*args, **kwargs) if attributes else {}
+                with tracer.span(span_name, root, **span_attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.is_recording(root):
+                return func(*args, **kwargs)
+            span_attributes = attributes(*args, **kwargs) if attributes else {}
+            with tracer.span(span_name, root, **span_attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+class TraceContextFilter(logging.Filter):
+    """Adds the current trace ID to log records as trace_id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True